@@ -1,31 +1,255 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+import csv
+import hashlib
+import io
+import json
+import os
 import sqlite3
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import banco
+import indice_codigos
+
+try:  # opcional: brotli para clientes que aceitam 'br' (com fallback para gzip)
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 app = FastAPI(title="CBHPM API")
 
+# Compressão só compensa em payloads maiores (listas, buscas)
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=1000)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+DB_NAME = banco.DB_NAME
+
+# Versões importadas raramente mudam: cache longo, revalidado por ETag/geração
+CACHE_VERSAO = f"public, max-age={int(os.environ.get('CBHPM_CACHE_MAX_AGE', 86400))}, stale-while-revalidate=604800"
+CACHE_LISTA = "public, max-age=60"
+
+CAMPOS = ["codigo", "descricao", "porte", "uco", "filme"]
+LOTE_EXPORT = 1000
+
 def conn():
-    return sqlite3.connect("data/cbhpm_database.db")
+    return sqlite3.connect(DB_NAME)
 
+# =====================================================
+# VALIDADORES HTTP (ETag / Last-Modified)
+# =====================================================
+def validadores(chave: str, geracoes: list[tuple[int, str]], cache: str) -> dict:
+    """ETag derivado das gerações de dados envolvidas; Last-Modified pela mais recente."""
+    etag = hashlib.sha1(f"{chave}|{sorted(geracoes)}".encode()).hexdigest()[:20]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache}
+    datas = [d for _, d in geracoes if d]
+    if datas:
+        ultima = datetime.fromisoformat(max(datas)).astimezone(timezone.utc)
+        headers["Last-Modified"] = format_datetime(ultima.replace(microsecond=0), usegmt=True)
+    return headers
+
+def nao_modificado(request: Request, headers: dict) -> bool:
+    """Requisição condicional satisfeita (If-None-Match tem precedência sobre If-Modified-Since)."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or headers["ETag"] in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and "Last-Modified" in headers:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# =====================================================
+# ENDPOINTS
+# =====================================================
 @app.get("/versoes")
-def versoes():
+def versoes(request: Request, response: Response):
     c = conn()
-    r = c.execute("SELECT DISTINCT versao FROM procedimentos").fetchall()
-    c.close()
-    return [x[0] for x in r]
+    try:
+        lista = banco.listar_versoes(c)
+        ger = banco.geracoes(c)
+        # Todas as gerações, inclusive de versões excluídas: a exclusão também
+        # avança o Last-Modified da lista
+        headers = validadores("versoes|" + "|".join(lista), list(ger.values()), CACHE_LISTA)
+        if nao_modificado(request, headers):
+            return Response(status_code=304, headers=headers)
+    finally:
+        c.close()
+    response.headers.update(headers)
+    return lista
 
 @app.get("/procedimento")
-def procedimento(codigo:str, versao:str):
+def procedimento(codigo:str, versao:str, request: Request, response: Response):
+    # Código em qualquer formatação ('1.01.01.01-2' = '10101012')
+    norm = banco.normalizar_codigo(codigo)
     c = conn()
-    r = c.execute("""
-        SELECT codigo,descricao,porte,uco,filme
-        FROM procedimentos
-        WHERE codigo = ? AND versao = ?
-    """,(codigo,versao)).fetchone()
-    c.close()
+    try:
+        # 304 sai antes de tocar na tabela de procedimentos
+        ger = banco.geracoes(c)
+        headers = validadores(f"{versao}|{banco.chave_codigo(codigo)}", [ger.get(versao, (0, ""))], CACHE_VERSAO)
+        if nao_modificado(request, headers):
+            return Response(status_code=304, headers=headers)
+        # Versão excluída mantém a geração (para o ETag), mas não tem índice
+        if versao in ger and banco.versao_existe(c, versao):
+            # Índice mmap compartilhado entre workers (reconstruído se a geração mudou)
+            reg = indice_codigos.garantir(c, versao, ger[versao][0]).buscar(codigo)
+            r = tuple(reg[k] for k in CAMPOS) if reg else None
+        else:
+            if versao in ger:
+                indice_codigos.remover(versao)
+            tabela = banco.tabela_versao(c, versao)
+            rows = c.execute(f"""
+                SELECT codigo,descricao,porte,uco,filme
+                FROM {tabela}
+                WHERE versao = ? AND codigo_norm = ?
+                ORDER BY codigo
+            """,(versao,norm)).fetchall()
+            # Mesmos dígitos não bastam: 'A1' e 'B1' são códigos diferentes
+            r = next((r for r in rows if banco.chave_codigo(r[0]) == banco.chave_codigo(codigo)), None)
+    finally:
+        c.close()
 
+    response.headers.update(headers)
     if not r:
+        # Código ausente pode surgir numa reimportação: cache curto
+        response.headers["Cache-Control"] = CACHE_LISTA
         return {"erro":"não encontrado"}
 
     return dict(zip(
         ["codigo","descricao","porte","uco","filme"], r
     ))
+
+@app.get("/procedimentos")
+def procedimentos(request: Request, response: Response, versao: str,
+                  after: str = "", limit: int = Query(500, ge=1, le=5000)):
+    """Listagem paginada por cursor: `proximo` vai no `after` da página seguinte."""
+    c = conn()
+    try:
+        # A geração basta para o 304 (a exclusão também a avança)
+        headers = validadores(f"lista|{versao}|{after}|{limit}",
+                              [banco.geracoes(c).get(versao, (0, ""))], CACHE_VERSAO)
+        if nao_modificado(request, headers):
+            return Response(status_code=304, headers=headers)
+        if not banco.versao_existe(c, versao):
+            return JSONResponse({"erro": "versão não encontrada"}, status_code=404)
+        tabela = banco.tabela_versao(c, versao)
+        rows = c.execute(f"""
+            SELECT codigo,descricao,porte,uco,filme
+            FROM {tabela}
+            WHERE versao = ? AND codigo > ?
+            ORDER BY codigo
+            LIMIT ?
+        """, (versao, after, limit)).fetchall()
+    finally:
+        c.close()
+
+    response.headers.update(headers)
+    return {
+        "versao": versao,
+        "itens": [dict(zip(CAMPOS, r)) for r in rows],
+        "proximo": rows[-1][0] if len(rows) == limit else None,
+    }
+
+@app.get("/busca")
+def busca(request: Request, response: Response, termo: str = "",
+          tipo: str = Query("codigo", pattern="^(codigo|descricao)$"),
+          after: str = "", limit: int = Query(100, ge=1, le=1000)):
+    """Busca em todas as versões numa chamada: um item por código, valores de cada versão lado a lado.
+
+    Pagina por código canônico: `proximo` vai no `after` da página seguinte.
+    """
+    c = conn()
+    try:
+        ger = banco.geracoes(c)
+        # Como em /versoes: gerações de versões excluídas também contam
+        headers = validadores(f"busca|{tipo}|{termo}|{after}|{limit}", list(ger.values()), CACHE_LISTA)
+        if nao_modificado(request, headers):
+            return Response(status_code=304, headers=headers)
+        rows, proximo = banco.buscar_todas_versoes(c, termo, tipo, limit, after)
+    finally:
+        c.close()
+
+    itens = []
+    for norm, versao, codigo, descricao, porte, uco, filme in rows:
+        chave = banco.chave_codigo(codigo)
+        if not itens or itens[-1]["codigo"] != chave:
+            itens.append({"codigo": chave, "descricao": descricao, "versoes": {}})
+        # Linhas vêm por nome de versão: fica a descrição da última em ordem
+        # alfabética ('CBHPM 5 (2009)' vem depois de 'CBHPM 2022'), não cronológica
+        itens[-1]["descricao"] = descricao
+        itens[-1]["versoes"].setdefault(versao, {"codigo": codigo, "porte": porte, "uco": uco, "filme": filme})
+
+    response.headers.update(headers)
+    return {"termo": termo, "tipo": tipo, "itens": itens, "proximo": proximo}
+
+def _linhas_export(versao: str, formato: str, comprimir: bool):
+    """Gera o arquivo da versão em blocos direto do cursor (memória constante).
+
+    A conexão fica aberta durante todo o streaming; a transação de leitura
+    garante um retrato consistente da versão mesmo com importações em paralelo.
+    """
+    # Cada bloco pode ser pedido por uma thread diferente do threadpool (uso sequencial)
+    c = sqlite3.connect(DB_NAME, check_same_thread=False)
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    try:
+        cur = c.execute(f"""
+            SELECT codigo,descricao,porte,uco,filme
+            FROM {banco.tabela_versao(c, versao)}
+            WHERE versao = ?
+            ORDER BY codigo
+        """, (versao,))
+        if formato == "csv":
+            buf = io.StringIO()
+            escritor = csv.writer(buf)
+            escritor.writerow(CAMPOS)
+        while True:
+            rows = cur.fetchmany(LOTE_EXPORT)
+            if not rows:
+                break
+            if formato == "csv":
+                escritor.writerows(rows)
+                bloco = buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+            else:
+                bloco = "".join(json.dumps(dict(zip(CAMPOS, r)), ensure_ascii=False) + "\n"
+                                for r in rows).encode("utf-8")
+            yield z.compress(bloco) if z else bloco
+        if formato == "csv" and buf.tell():
+            bloco = buf.getvalue().encode("utf-8")
+            yield z.compress(bloco) if z else bloco
+        if z:
+            yield z.flush()
+    finally:
+        c.close()
+
+@app.get("/versoes/{versao}/export")
+def exportar_versao(versao: str, request: Request,
+                    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"), gzip: bool = False):
+    """Versão inteira em NDJSON ou CSV, em streaming (gzip=true comprime na origem)."""
+    c = conn()
+    try:
+        headers = validadores(f"export|{versao}|{formato}|{gzip}",
+                              [banco.geracoes(c).get(versao, (0, ""))], CACHE_VERSAO)
+        if nao_modificado(request, headers):
+            return Response(status_code=304, headers=headers)
+        if not banco.versao_existe(c, versao):
+            return JSONResponse({"erro": "versão não encontrada"}, status_code=404)
+    finally:
+        c.close()
+
+    media = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    nome = "".join(ch if ch.isalnum() else "_" for ch in versao)
+    headers["Content-Disposition"] = f'attachment; filename="cbhpm_{nome}.{formato}{".gz" if gzip else ""}"'
+    if gzip:
+        # O arquivo .gz é o próprio conteúdo (sem Content-Encoding, o cliente não
+        # o descompacta); o GZipMiddleware não recomprime application/gzip
+        media = "application/gzip"
+    return StreamingResponse(_linhas_export(versao, formato, gzip), media_type=media, headers=headers)
@@ -5,10 +5,6 @@ import base64
 import hashlib
 import time
 import sqlite3
-from io import BytesIO
-from contextlib import contextmanager
-from datetime import datetime
-import csv
 import random
 
 import pandas as pd
@@ -16,10 +12,15 @@ import requests
 import altair as alt
 import streamlit as st
 
+import banco
+import indice_codigos
+import negocio
+import sincronizacao
+
 # =====================================================
 # CONFIGURAÇÕES & ESTADO
 # =====================================================
-DB_NAME = "data/cbhpm_database.db"
+DB_NAME = banco.DB_NAME
 os.makedirs("data", exist_ok=True)
 
 # Configuração de página
@@ -28,6 +29,12 @@ st.title("⚖️ CBHPM • Auditoria e Gestão")
 
 DEBUG = bool(st.secrets.get("DEBUG", False))
 UCO_DEFAULT = float(st.secrets.get("UCO_VALOR", 1.00))
+# Layout opcional: cada versão importada vira um arquivo SQLite próprio (data/versoes)
+PARTICIONADO = bool(st.secrets.get("LAYOUT_PARTICIONADO", False))
+# Compressão dos arquivos no repositório remoto: None, "gzip" (.gz) ou "zstd" (.zst)
+COMPRESSAO = st.secrets.get("GITHUB_COMPRESSAO") or None
+# Teto de códigos por busca em todas as versões (a api.py pagina por cursor)
+LIMITE_TODAS_VERSOES = 500
 
 # Estados iniciais
 if "comparacao_realizada" not in st.session_state:
@@ -46,9 +53,6 @@ def warn_user(msg: str, exc: Exception | None = None) -> None:
     else:
         st.warning(msg)
 
-def sanitize_str(x) -> str:
-    return str(x).strip()
-
 def moeda_br(v: float) -> str:
     """Formata valor monetário no padrão pt-BR."""
     s = f"{v:,.2f}"
@@ -58,99 +62,31 @@ def moeda_br(v: float) -> str:
 # CONEXÃO E BANCO DE DADOS
 # =====================================================
 @st.cache_resource
+def get_gerenciador() -> banco.GerenciadorConexoes:
+    """Compartilhado por todas as sessões: leitores por thread + escritor único."""
+    return banco.GerenciadorConexoes(DB_NAME, timeout=60)
+
 def get_connection() -> sqlite3.Connection:
-    """Conexão SQLite com PRAGMAs para desempenho e integridade."""
-    con = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=60)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    cur.executescript("""
-        PRAGMA journal_mode=WAL;
-        PRAGMA synchronous=NORMAL;
-        PRAGMA foreign_keys=ON;
-    """)
-    return con
-
-@contextmanager
-def gerenciar_db():
-    con = get_connection()
-    try:
-        yield con
-        con.commit()
-    except Exception as e:
-        con.rollback()
-        raise e
+    """Conexão de leitura da thread atual (somente leitura; WAL permite paralelismo)."""
+    return get_gerenciador().leitura()
+
+def escrever_db(fn, *args, **kwargs):
+    """Executa fn(con, ...) no escritor único, numa transação (commit/rollback automáticos)."""
+    return get_gerenciador().escrever(fn, *args, **kwargs)
 
 def criar_tabelas() -> None:
     """Cria tabelas e índices básicos."""
-    with gerenciar_db() as con:
-        cur = con.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS procedimentos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                codigo TEXT NOT NULL,
-                descricao TEXT NOT NULL,
-                porte REAL NOT NULL DEFAULT 0,
-                uco REAL NOT NULL DEFAULT 0,
-                filme REAL NOT NULL DEFAULT 0,
-                versao TEXT NOT NULL,
-                UNIQUE (codigo, versao)
-            )
-        """)
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_cod ON procedimentos (codigo)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_ver ON procedimentos (versao)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_desc ON procedimentos (descricao)")
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS arquivos_importados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hash TEXT UNIQUE,
-                versao TEXT NOT NULL,
-                data TEXT NOT NULL
-            )
-        """)
+    escrever_db(banco.criar_tabelas)
 
 # =====================================================
 # UTILITÁRIOS
 # =====================================================
-def to_float(v) -> float:
-    if pd.isna(v) or v == "":
-        return 0.0
-    if isinstance(v, str):
-        v = v.replace(".", "").replace(",", ".").strip()
-    try:
-        return float(v)
-    except:
-        return 0.0
-
 def gerar_hash_arquivo(uploaded_file) -> str:
     uploaded_file.seek(0)
     h = hashlib.sha256(uploaded_file.read()).hexdigest()
     uploaded_file.seek(0)
     return h
 
-def extrair_valor(row, df: pd.DataFrame, col_opts: list[str]) -> float:
-    for c in col_opts:
-        if c in df.columns:
-            return to_float(row[c])
-    return 0.0
-
-def read_csv_smart(file) -> pd.DataFrame:
-    """Detecta BOM, encoding e delimitador de forma robusta para CSV."""
-    file.seek(0)
-    content = file.read()
-    # Remove BOM, se existir
-    if content.startswith(b"\xef\xbb\xbf"):
-        content = content[3:]
-    # Tenta encodings comuns
-    for enc in ("utf-8", "latin-1"):
-        try:
-            sample_str = content[:2048].decode(enc)
-            sep = csv.Sniffer().sniff(sample_str, delimiters=[",", ";", "\t", "|"]).delimiter
-            return pd.read_csv(BytesIO(content), sep=sep, encoding=enc)
-        except Exception:
-            continue
-    # Fallback
-    return pd.read_csv(BytesIO(content), sep=";", encoding="latin-1")
-
 # =====================================================
 # GITHUB – PERSISTÊNCIA (timeout + backoff)
 # =====================================================
@@ -171,8 +107,32 @@ def _request_with_retry(method: str, url: str, headers=None, json=None, params=N
             time.sleep((2 ** i) + 0.2)
     return None
 
+def _caminho_remoto(caminho: str) -> str:
+    return caminho + sincronizacao.EXTENSOES.get(COMPRESSAO, "")
+
+def _baixar_arquivo_github(caminho: str, repo: str, token: str, branch: str) -> bool:
+    """Baixa um arquivo do repositório para `caminho` em streaming; retorna True se houve conteúdo.
+
+    Os metadados (size/sha) vêm da API de conteúdo; o arquivo em si vem no formato
+    raw (sem base64 nem limite de 1 MB), verificado antes de substituir o local.
+    """
+    url = f"https://api.github.com/repos/{repo}/contents/{_caminho_remoto(caminho)}"
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
+    r = _request_with_retry("GET", url, headers=headers, params={"ref": branch}, timeout=10)
+    if not r or r.status_code != 200:
+        return False
+    meta = r.json()
+    if not meta.get("size"):
+        return False
+    sincronizacao.baixar_arquivo(
+        url, caminho,
+        headers={**headers, "Accept": "application/vnd.github.raw"}, params={"ref": branch},
+        compressao=COMPRESSAO, tamanho=meta["size"], sha1_git=meta.get("sha"),
+    )
+    return True
+
 def baixar_banco() -> None:
-    """Baixa o arquivo de banco do GitHub, se não existir localmente."""
+    """Baixa o arquivo de banco do GitHub (e as partições do catálogo), se não existirem localmente."""
     if os.path.exists(DB_NAME):
         return
     try:
@@ -184,41 +144,70 @@ def baixar_banco() -> None:
             open(DB_NAME, "wb").close()
             return
 
-        url = f"https://api.github.com/repos/{repo}/contents/{DB_NAME}"
-        headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
-        r = _request_with_retry("GET", url, headers=headers, params={"ref": branch}, timeout=10)
-        if r and r.status_code == 200:
-            content = r.json().get("content")
-            if content:
-                with open(DB_NAME, "wb") as f:
-                    f.write(base64.b64decode(content))
-            else:
-                open(DB_NAME, "wb").close()
-        else:
+        if not _baixar_arquivo_github(DB_NAME, repo, token, branch):
             open(DB_NAME, "wb").close()
+            return
     except Exception as e:
         warn_user("Falha ao baixar banco do GitHub. Criando DB local vazio.", e)
         open(DB_NAME, "wb").close()
+        return
 
-def salvar_banco_github(msg: str) -> None:
-    """Sincroniza o arquivo SQLite para o repositório com retry/backoff."""
+    # Partições (layout particionado): um arquivo por versão. Falhas aqui não
+    # tocam no banco principal já baixado e verificado.
+    try:
+        con = sqlite3.connect(DB_NAME)
+        try:
+            arquivos = [arq for _, arq in banco.particoes(con).values()]
+        finally:
+            con.close()
+        os.makedirs(banco.DIR_VERSOES, exist_ok=True)
+    except Exception as e:
+        warn_user("Falha ao ler o catálogo de partições do banco baixado.", e)
+        return
+    for arq in arquivos:
+        if os.path.exists(arq):
+            continue
+        try:
+            if not _baixar_arquivo_github(arq, repo, token, branch):
+                warn_user(f"Partição '{arq}' não encontrada no GitHub.")
+        except Exception as e:
+            warn_user(f"Falha ao baixar a partição '{arq}' do GitHub.", e)
+
+def salvar_banco_github(msg: str, caminho: str = DB_NAME) -> bool:
+    """Sincroniza um snapshot consistente do arquivo SQLite para o repositório com retry/backoff.
+
+    Retorna True se o arquivo foi enviado (falhas só avisam o usuário).
+    """
     try:
         repo = st.secrets.get('GITHUB_REPO')
         token = st.secrets.get('GITHUB_TOKEN')
         branch = st.secrets.get('GITHUB_BRANCH', 'main')
         if not repo or not token:
             warn_user("Sincronização com GitHub indisponível (verifique secrets).")
-            return
+            return False
 
-        # Aviso de tamanho grande
-        size_mb = os.path.getsize(DB_NAME) / (1024 * 1024)
-        if size_mb > 90:
-            warn_user(f"Arquivo do banco com {size_mb:.1f} MB. Commits grandes podem falhar no GitHub.")
+        if caminho == DB_NAME:
+            # Estatísticas do planejador atualizadas antes de gerar o snapshot
+            try:
+                escrever_db(banco.otimizar)
+            except Exception as e:
+                warn_user("Falha ao otimizar o banco antes da sincronização.", e)
 
-        with open(DB_NAME, "rb") as f:
-            content = base64.b64encode(f.read()).decode()
+        # Envia um snapshot (VACUUM INTO), não o arquivo em uso: inclui o que
+        # ainda está no -wal e sai compactado
+        snapshot = sincronizacao.gerar_snapshot(caminho)
+        try:
+            # Aviso de tamanho grande
+            size_mb = os.path.getsize(snapshot) / (1024 * 1024)
+            if size_mb > 90:
+                warn_user(f"Arquivo do banco com {size_mb:.1f} MB. Commits grandes podem falhar no GitHub.")
+
+            with open(snapshot, "rb") as f:
+                content = base64.b64encode(sincronizacao.comprimir(f.read(), COMPRESSAO)).decode()
+        finally:
+            os.remove(snapshot)
 
-        api_url = f"https://api.github.com/repos/{repo}/contents/{DB_NAME}"
+        api_url = f"https://api.github.com/repos/{repo}/contents/{_caminho_remoto(caminho)}"
         headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
 
         # GET para obter sha
@@ -231,6 +220,30 @@ def salvar_banco_github(msg: str) -> None:
         put_r = _request_with_retry("PUT", api_url, headers=headers, json=payload, timeout=20)
         if not put_r or put_r.status_code not in (200, 201):
             warn_user(f"Erro na sincronização com GitHub (status {put_r.status_code if put_r else 'N/A'}).")
+            return False
+        return True
+    except Exception as e:
+        warn_user("Erro na sincronização com GitHub.", e)
+        return False
+
+def remover_arquivo_github(caminho: str, msg: str) -> None:
+    """Remove do repositório o arquivo de uma partição descartada."""
+    try:
+        repo = st.secrets.get('GITHUB_REPO')
+        token = st.secrets.get('GITHUB_TOKEN')
+        branch = st.secrets.get('GITHUB_BRANCH', 'main')
+        if not repo or not token:
+            return
+
+        api_url = f"https://api.github.com/repos/{repo}/contents/{_caminho_remoto(caminho)}"
+        headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
+        r = _request_with_retry("GET", api_url, headers=headers, params={"ref": branch}, timeout=10)
+        if not r or r.status_code != 200:
+            return  # nunca foi sincronizado
+        payload = {"message": msg, "sha": r.json().get("sha"), "branch": branch}
+        del_r = _request_with_retry("DELETE", api_url, headers=headers, json=payload, timeout=20)
+        if not del_r or del_r.status_code not in (200, 201):
+            warn_user(f"Erro ao remover '{caminho}' do GitHub (status {del_r.status_code if del_r else 'N/A'}).")
     except Exception as e:
         warn_user("Erro na sincronização com GitHub.", e)
 
@@ -243,118 +256,103 @@ def importar(arquivos: list, versao: str) -> bool:
         st.error("Informe a Versão CBHPM.")
         return False
 
-    mapa = {
-        "codigo": ["Código", "Codigo"],
-        "descricao": ["Descrição", "Descricao"],
-        "porte": ["Porte"],
-        "uco": ["UCO", "CH"],
-        "filme": ["Filme"]
-    }
-
     arquivos_processados = 0
+    registros, hashes = [], []
     prog = st.progress(0, text="Preparando importação...")
     total_arqs = max(len(arquivos), 1)
 
-    with gerenciar_db() as con:
-        cur = con.cursor()
+    # Leitura e validação na thread da sessão; a gravação vai inteira para o escritor
+    con = get_connection()
+    for idx, arq in enumerate(arquivos, start=1):
+        try:
+            h = gerar_hash_arquivo(arq)
+            ja = h in hashes or con.execute("SELECT 1 FROM arquivos_importados WHERE hash=?", (h,)).fetchone()
+            if ja:
+                st.warning(f"O arquivo '{arq.name}' já foi importado anteriormente.")
+                prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (já importado)")
+                continue
 
-        for idx, arq in enumerate(arquivos, start=1):
+            # Leitura robusta (CSV/Excel)
             try:
-                h = gerar_hash_arquivo(arq)
-                cur.execute("SELECT 1 FROM arquivos_importados WHERE hash=?", (h,))
-                if cur.fetchone():
-                    st.warning(f"O arquivo '{arq.name}' já foi importado anteriormente.")
-                    prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (já importado)")
-                    continue
-
-                # Leitura robusta (CSV/Excel)
-                try:
-                    if arq.name.lower().endswith(".csv"):
-                        df = read_csv_smart(arq)
-                    elif arq.name.lower().endswith(".xls"):
-                        df = pd.read_excel(arq, engine="xlrd")
-                    else:  # .xlsx
-                        try:
-                            df = pd.read_excel(arq, engine="openpyxl")
-                        except Exception:
-                            df = pd.read_excel(arq)  # fallback
-                except Exception as e:
-                    st.error(f"Erro ao ler {arq.name}: {e}")
-                    prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (erro de leitura)")
-                    continue
-
-                # Normaliza cabeçalhos
-                df.columns = [c.strip() for c in df.columns]
-
-                # Valida presença de colunas de código e descrição
-                cod_col = next((c for c in mapa["codigo"] if c in df.columns), None)
-                desc_col = next((c for c in mapa["descricao"] if c in df.columns), None)
-                if cod_col is None or desc_col is None:
-                    st.error(f"Arquivo {arq.name} não contém colunas de Código/Descrição esperadas.")
-                    prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (colunas inválidas)")
-                    continue
-
-                # Lista de registros
-                dados_lista = []
-                pulados = 0
-                for _, row in df.iterrows():
-                    d = {campo: extrair_valor(row, df, cols) for campo, cols in mapa.items()}
-                    cod = sanitize_str(row[cod_col])
-                    desc = sanitize_str(row[desc_col])
-                    if not cod or not desc:
-                        pulados += 1
-                        continue
-                    dados_lista.append((cod, desc, d["porte"], d["uco"], d["filme"], versao))
-
-                # UPSERT em chunks
-                SQL_UPSERT = """
-                INSERT INTO procedimentos (codigo, descricao, porte, uco, filme, versao)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(codigo, versao) DO UPDATE SET
-                  descricao=excluded.descricao,
-                  porte=excluded.porte,
-                  uco=excluded.uco,
-                  filme=excluded.filme
-                """
-                CHUNK = 5000
-                for i in range(0, len(dados_lista), CHUNK):
-                    cur.executemany(SQL_UPSERT, dados_lista[i:i+CHUNK])
-
-                cur.execute("INSERT OR IGNORE INTO arquivos_importados (hash, versao, data) VALUES (?, ?, ?)",
-                            (h, versao, datetime.now().isoformat()))
-                arquivos_processados += 1
-
-                prog.progress(min(idx / total_arqs, 1.0),
-                              text=f"Arquivo {idx}/{total_arqs} importado (linhas válidas: {len(dados_lista)}; puladas: {pulados})")
+                df = negocio.ler_arquivo(arq)
             except Exception as e:
-                warn_user(f"Falha ao importar '{getattr(arq, 'name', 'arquivo')}'.", e)
-                prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (falha)")
+                st.error(f"Erro ao ler {arq.name}: {e}")
+                prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (erro de leitura)")
+                continue
 
-    if arquivos_processados > 0:
-        salvar_banco_github(f"Importação {versao} — {arquivos_processados} arquivo(s)")
-        return True
-    return False
+            # Valida presença de colunas de código e descrição
+            extraidos = negocio.extrair_registros(df, versao)
+            if extraidos is None:
+                st.error(f"Arquivo {arq.name} não contém colunas de Código/Descrição esperadas.")
+                prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (colunas inválidas)")
+                continue
+
+            dados_lista, pulados = extraidos
+            registros.extend(dados_lista)
+            hashes.append(h)
+            arquivos_processados += 1
+            prog.progress(min(idx / total_arqs, 1.0),
+                          text=f"Arquivo {idx}/{total_arqs} lido (linhas válidas: {len(dados_lista)}; puladas: {pulados})")
+        except Exception as e:
+            warn_user(f"Falha ao importar '{getattr(arq, 'name', 'arquivo')}'.", e)
+            prog.progress(min(idx / total_arqs, 1.0), text=f"Arquivo {idx}/{total_arqs} (falha)")
+
+    if arquivos_processados == 0:
+        return False
+
+    prog.progress(1.0, text=f"Gravando {len(registros)} linhas de {versao}...")
+    try:
+        particionada, anterior = escrever_db(negocio.gravar_importacao, versao, registros, hashes, PARTICIONADO)
+    except Exception as e:
+        warn_user(f"Falha ao gravar a importação de {versao}.", e)
+        return False
+    prog.progress(1.0, text=f"{versao}: {len(registros)} linhas gravadas")
+
+    # Índice mmap da versão (Calcular e api.py); sem ele as buscas caem no SQLite
+    try:
+        con = get_connection()
+        indice_codigos.construir(con, versao, banco.geracoes(con).get(versao, (0, ""))[0])
+    except Exception as e:
+        warn_user("Falha ao gerar o índice de códigos da versão.", e)
+
+    # Partição nova antes do banco que aponta para ela; a anterior sai por último,
+    # só se o banco remoto já foi trocado (até lá ele ainda aponta para ela)
+    enviado = not particionada or salvar_banco_github(
+        f"Importação {versao} — partição", banco.particoes(get_connection())[versao][1])
+    enviado = enviado and salvar_banco_github(f"Importação {versao} — {arquivos_processados} arquivo(s)")
+    if anterior:
+        banco.descartar_particao(anterior)
+        if enviado:
+            remover_arquivo_github(anterior, f"Partição substituída de {versao}")
+    return True
 
 @st.cache_data(ttl=300)
 def versoes() -> list[str]:
     with get_connection() as con:
         try:
-            return pd.read_sql("SELECT DISTINCT versao FROM procedimentos ORDER BY versao", con)["versao"].tolist()
+            return banco.listar_versoes(con)
         except Exception:
             return []
 
 def buscar_dados(termo: str, versao: str, tipo: str) -> pd.DataFrame:
-    campo = "codigo" if tipo == "Código" else "descricao"
     with get_connection() as con:
-        return pd.read_sql(
-            f"""
-            SELECT codigo, descricao, porte, uco, filme
-            FROM procedimentos
-            WHERE {campo} LIKE ? AND versao = ?
-            ORDER BY codigo
-            """,
-            con, params=(f"%{termo}%", versao)
-        )
+        return negocio.buscar_dados(con, termo, versao, tipo)
+
+def buscar_todas_versoes(termo: str, tipo: str) -> tuple[pd.DataFrame, bool]:
+    """Uma linha por código com o porte de cada versão; True se passou de LIMITE_TODAS_VERSOES."""
+    tabela, proximo = negocio.buscar_todas_versoes(get_connection(), termo, tipo, LIMITE_TODAS_VERSOES)
+    return tabela, proximo is not None
+
+def buscar_codigo(codigo: str, versao: str):
+    """Registro exato pelo índice mmap da versão; sem índice, pela chave canônica no SQLite."""
+    con = get_connection()
+    ger = banco.geracoes(con).get(versao)
+    if ger is not None and banco.versao_existe(con, versao):
+        return indice_codigos.garantir(con, versao, ger[0]).buscar(codigo)
+    if ger is not None:
+        # Versão excluída: um índice que sobrou no disco seria vazio ou obsoleto
+        indice_codigos.remover(versao)
+    return negocio.buscar_codigo(con, codigo, versao)
 
 def show_dataframe_paginated(df: pd.DataFrame, page_size: int = 200) -> None:
     total = len(df)
@@ -371,6 +369,19 @@ def show_dataframe_paginated(df: pd.DataFrame, page_size: int = 200) -> None:
     e = s + page_size
     st.dataframe(df.iloc[s:e], use_container_width=True, hide_index=True)
 
+@st.cache_resource
+def inicializar_banco() -> None:
+    """Uma vez por processo: baixa o banco remoto (se ausente) e garante as tabelas."""
+    baixar_banco()
+    criar_tabelas()
+    # Partições de importações desfeitas (rollback) ou já substituídas
+    try:
+        escrever_db(banco.limpar_particoes_orfas)
+    except Exception as e:
+        warn_user("Falha ao limpar partições órfãs.", e)
+
+inicializar_banco()
+
 # =====================================================
 # TEMA GLOBAL (CSS) — sem “barra branca” de aparência de input
 # =====================================================
@@ -547,6 +558,8 @@ if aba_atual == "📋 Consultar":
             c1, c2 = st.columns([1, 3])
             tipo = c1.radio("Busca por", ["Código", "Descrição"], horizontal=True, help="Escolha por código ou descrição.")
             termo = c2.text_input("Digite o termo de busca...", help="Ex.: '10101012' ou parte da descrição.")
+            todas = st.checkbox("Buscar em todas as versões",
+                                help="Ignora a Tabela Ativa e mostra o porte do código em cada versão, lado a lado.")
             pesquisar = st.form_submit_button("🔎 Pesquisar")
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -554,7 +567,12 @@ if aba_atual == "📋 Consultar":
             if termo.strip() == "":
                 st.warning("Digite um termo de busca antes de pesquisar.")
             else:
-                res = buscar_dados(termo, v_selecionada, tipo)
+                if todas:
+                    res, truncado = buscar_todas_versoes(termo, tipo)
+                    if truncado:
+                        st.info(f"Mostrando os primeiros {LIMITE_TODAS_VERSOES} códigos; refine o termo para ver os demais.")
+                else:
+                    res = buscar_dados(termo, v_selecionada, tipo)
                 if res.empty:
                     st.info("Nenhum resultado encontrado para o termo informado.")
                 else:
@@ -600,11 +618,10 @@ if aba_atual == "🧮 Calcular":
         if not cod_calc:
             st.info("Informe o **Código do Procedimento** para calcular.")
         else:
-            res = buscar_dados(cod_calc, v_selecionada, "Código")
-            if res.empty:
+            p = buscar_codigo(cod_calc, v_selecionada)
+            if p is None:
                 st.error(f"O código '{cod_calc}' não foi encontrado na tabela {v_selecionada}.")
             else:
-                p = res.iloc[0]
                 f_porte = (1 + infla/100) if (aplicar_porte and infla != 0) else 1.0
                 f_uco   = (1 + infla/100) if (aplicar_uco   and infla != 0) else 1.0
                 f_filme = (1 + infla/100) if (aplicar_filme and infla != 0) else 1.0
@@ -671,16 +688,11 @@ if aba_atual == "⚖️ Comparar":
             st.session_state.comparacao_realizada = True
 
         if st.session_state.comparacao_realizada:
-            df1 = buscar_dados("", v1, "Código")
-            df2 = buscar_dados("", v2, "Código").rename(
-                columns={"porte": "porte_2", "uco": "uco_2", "filme": "filme_2", "descricao": "desc_2"}
-            )
-            comp = df1.merge(df2, on="codigo")
+            con = get_connection()
+            comp = negocio.comparar_versoes(negocio.dados_versao(con, v1), negocio.dados_versao(con, v2))
 
             if not comp.empty:
                 base = comp['porte']
-                # var % com NaN quando porte=0
-                comp['var_porte'] = ((comp['porte_2'] - base) / base.replace(0, pd.NA)) * 100
 
                 m1, m2, m3, m4 = st.columns(4)
                 m1.metric("Itens Comuns", len(comp))
@@ -688,7 +700,7 @@ if aba_atual == "⚖️ Comparar":
                 m3.metric("Mediana var. porte", f"{comp['var_porte'].dropna().median():.2f}%")
                 m4.metric("Porte=0 (base)", int((base == 0).sum()))
 
-                resumo = comp.groupby(comp['codigo'].str[:2], dropna=False)['var_porte'].mean().reset_index()
+                resumo = comp.groupby(comp['codigo_norm'].str[:2].rename('codigo'), dropna=False)['var_porte'].mean().reset_index()
                 chart = alt.Chart(resumo).mark_bar().encode(
                     x=alt.X('codigo:N', title="Grupo (Capítulo)"),
                     y=alt.Y('var_porte:Q', title="Variação % (média)"),
@@ -720,26 +732,9 @@ if aba_atual == "📤 Exportar":
         st.caption("Gere um backup completo da base (procedimentos e arquivos importados).")
         st.markdown('<div class="card">', unsafe_allow_html=True)
         if st.button("📦 Gerar Backup Completo (Excel)"):
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                with get_connection() as con:
-                    df1 = pd.read_sql("SELECT * FROM procedimentos", con)
-                    df2 = pd.read_sql("SELECT * FROM arquivos_importados", con)
-
-                df1.to_excel(writer, index=False, sheet_name="procedimentos")
-                df2.to_excel(writer, index=False, sheet_name="arquivos_importados")
-
-                # autoajuste de colunas
-                for sheet_name, df in [("procedimentos", df1), ("arquivos_importados", df2)]:
-                    ws = writer.sheets[sheet_name]
-                    for i, col in enumerate(df.columns):
-                        try:
-                            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                        except Exception:
-                            max_len = len(col) + 2
-                        ws.set_column(i, i, min(max_len, 40))
-
-            st.download_button("📥 Baixar Arquivo", output.getvalue(), "cbhpm_completa.xlsx")
+            with get_connection() as con:
+                backup = negocio.gerar_backup_excel(con)
+            st.download_button("📥 Baixar Arquivo", backup, "cbhpm_completa.xlsx")
         st.markdown('</div>', unsafe_allow_html=True)
     else:
         st.warning("Nenhuma versão disponível para exportar. Importe dados na aba '📥 Importar'.")
@@ -758,10 +753,15 @@ if aba_atual == "🗑️ Gerenciar":
         confirmar = st.checkbox("Confirmo a exclusão definitiva desta versão e sincronização com GitHub.")
         if st.button("🗑️ Deletar Versão", type="primary"):
             if confirmar:
-                with gerenciar_db() as con:
-                    con.execute("DELETE FROM procedimentos WHERE versao=?", (v_del,))
-                    con.execute("DELETE FROM arquivos_importados WHERE versao=?", (v_del,))
-                salvar_banco_github(f"Remoção da versão {v_del}")
+                # Particionada: descarta o arquivo (sem DELETE linha a linha)
+                arq_removido = escrever_db(negocio.remover_versao, v_del)
+                indice_codigos.remover(v_del)
+                # Banco antes da partição: o remoto não pode apontar para um arquivo já apagado
+                enviado = salvar_banco_github(f"Remoção da versão {v_del}")
+                if arq_removido:
+                    banco.descartar_particao(arq_removido)
+                    if enviado:
+                        remover_arquivo_github(arq_removido, f"Remoção da partição {v_del}")
                 st.cache_data.clear()
                 st.success("Versão removida!")
                 time.sleep(1)
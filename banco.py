@@ -0,0 +1,563 @@
+# CBHPM – camada SQLite compartilhada entre app.py e api.py (sem Streamlit)
+import os
+import re
+import queue
+import hashlib
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+# =====================================================
+# CONFIGURAÇÕES
+# =====================================================
+DB_NAME = "data/cbhpm_database.db"
+DIR_VERSOES = "data/versoes"
+
+SCHEMA_PROCEDIMENTOS = """
+    CREATE TABLE IF NOT EXISTS procedimentos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codigo TEXT NOT NULL,
+        descricao TEXT NOT NULL,
+        porte REAL NOT NULL DEFAULT 0,
+        uco REAL NOT NULL DEFAULT 0,
+        filme REAL NOT NULL DEFAULT 0,
+        versao TEXT NOT NULL,
+        codigo_norm TEXT NOT NULL DEFAULT '',
+        UNIQUE (codigo, versao)
+    )
+"""
+
+SQL_UPSERT = """
+    INSERT INTO procedimentos (codigo, descricao, porte, uco, filme, versao, codigo_norm)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(codigo, versao) DO UPDATE SET
+      descricao=excluded.descricao,
+      porte=excluded.porte,
+      uco=excluded.uco,
+      filme=excluded.filme
+"""
+
+COLUNAS = "codigo, descricao, porte, uco, filme, versao, codigo_norm"
+
+def normalizar_codigo(codigo) -> str:
+    """Chave de busca indexada: só dígitos ('1.01.01.01-2 ' → '10101012'); '' se não houver dígitos."""
+    return re.sub(r"\D", "", str(codigo))
+
+def chave_codigo(codigo) -> str:
+    """Identidade do código: sem pontos, hífens e espaços ('1.01.01.01-2' = '10101012', 'A1' ≠ 'B1').
+
+    Dois códigos só são o mesmo procedimento se a chave coincidir; codigo_norm
+    (só dígitos) serve para achar candidatos pelo índice, não para decidir.
+    """
+    return re.sub(r"[.\-\s]", "", str(codigo))
+
+def com_codigo_norm(con: sqlite3.Connection, registros: list[tuple],
+                    tabela: str = "procedimentos") -> list[tuple]:
+    """Acrescenta codigo_norm às tuplas (codigo, descricao, porte, uco, filme, versao).
+
+    Se a versão já tem o mesmo código só com outra formatação (pontos, hífens,
+    espaços), reaproveita o código gravado: a reimportação atualiza a mesma
+    linha em vez de duplicá-la. Códigos sem dígitos são gravados como vieram.
+    """
+    gravados: dict[tuple[str, str], str] = {}
+    for v in {r[5] for r in registros}:
+        rows = con.execute(f"SELECT codigo FROM {tabela} WHERE versao = ? AND codigo_norm <> '' ORDER BY codigo DESC",
+                           (v,)).fetchall()
+        gravados.update({(v, chave_codigo(r[0])): r[0] for r in rows})
+    saida = []
+    for r in registros:
+        norm = normalizar_codigo(r[0])
+        codigo = gravados.setdefault((r[5], chave_codigo(r[0])), r[0]) if norm else r[0]
+        saida.append((codigo, *r[1:], norm))
+    # Códigos distintos nunca podem cair na mesma linha (UNIQUE codigo, versao)
+    if len({(r[5], r[0]) for r in saida}) != len({(r[5], chave_codigo(r[0]) if normalizar_codigo(r[0]) else r[0])
+                                                 for r in registros}):
+        raise ValueError("Códigos distintos mapeados para a mesma linha na importação.")
+    return saida
+
+def migrar_codigo_norm(con: sqlite3.Connection, schema: str = "main") -> None:
+    """Adiciona e preenche codigo_norm em bancos anteriores à coluna; cria o índice (versao, codigo_norm)."""
+    colunas = {r[1] for r in con.execute(f"PRAGMA {schema}.table_info(procedimentos)").fetchall()}
+    if not colunas:
+        return
+    if "codigo_norm" not in colunas:
+        con.execute(f"ALTER TABLE {schema}.procedimentos ADD COLUMN codigo_norm TEXT NOT NULL DEFAULT ''")
+        rows = con.execute(f"SELECT id, codigo FROM {schema}.procedimentos").fetchall()
+        con.executemany(f"UPDATE {schema}.procedimentos SET codigo_norm=? WHERE id=?",
+                        [(normalizar_codigo(c), i) for i, c in rows])
+    con.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_proc_ver_norm ON procedimentos (versao, codigo_norm)")
+
+def migrar_particao(arquivo: str) -> None:
+    """Migra o arquivo de uma partição antes do ATTACH (conexões de leitura são query_only)."""
+    m = sqlite3.connect(arquivo, timeout=60)
+    try:
+        colunas = {r[1] for r in m.execute("PRAGMA table_info(procedimentos)").fetchall()}
+        if colunas and "codigo_norm" not in colunas:
+            # Refaz a checagem com a trava de escrita: outra thread pode ter migrado antes
+            m.execute("BEGIN IMMEDIATE")
+            migrar_codigo_norm(m)
+            m.commit()
+    finally:
+        m.close()
+
+def criar_tabelas(con: sqlite3.Connection) -> None:
+    """Cria tabelas e índices básicos do banco principal."""
+    cur = con.cursor()
+    cur.execute(SCHEMA_PROCEDIMENTOS)
+    migrar_codigo_norm(con)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_cod ON procedimentos (codigo)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_ver ON procedimentos (versao)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_desc ON procedimentos (descricao)")
+    # Paginação por cursor (versao = ? AND codigo > ? ORDER BY codigo)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_proc_ver_cod ON procedimentos (versao, codigo)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS arquivos_importados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT UNIQUE,
+            versao TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    criar_catalogo(con)
+
+def gravar_registros(con: sqlite3.Connection, registros: list[tuple], chunk: int = 5000) -> None:
+    """UPSERT em chunks na tabela única."""
+    registros = com_codigo_norm(con, registros)
+    for i in range(0, len(registros), chunk):
+        con.executemany(SQL_UPSERT, registros[i:i+chunk])
+
+# =====================================================
+# CATÁLOGO DE PARTIÇÕES (uma versão = um arquivo SQLite)
+# =====================================================
+def criar_catalogo(con: sqlite3.Connection) -> None:
+    """Cria o catálogo de versões (partições e gerações de dados) no banco principal."""
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS particoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            versao TEXT UNIQUE NOT NULL,
+            arquivo TEXT NOT NULL,
+            linhas INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS geracoes (
+            versao TEXT PRIMARY KEY,
+            geracao INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )
+    """)
+
+def otimizar(con: sqlite3.Connection, intervalo_analyze: timedelta = timedelta(days=7)) -> str:
+    """ANALYZE completo se o último tiver mais que `intervalo_analyze`; senão PRAGMA optimize.
+
+    As estatísticas (sqlite_stat1) vão junto no snapshot enviado ao repositório,
+    então quem baixa o banco já planeja as consultas com elas. Retorna o que rodou.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS manutencao (
+            tarefa TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+    """)
+    agora = datetime.now(timezone.utc)
+    r = con.execute("SELECT data FROM manutencao WHERE tarefa='analyze'").fetchone()
+    if r is None or agora - datetime.fromisoformat(r[0]) > intervalo_analyze:
+        con.execute("ANALYZE")
+        con.execute("""
+            INSERT INTO manutencao (tarefa, data) VALUES ('analyze', ?)
+            ON CONFLICT(tarefa) DO UPDATE SET data=excluded.data
+        """, (agora.isoformat(),))
+        return "analyze"
+    con.execute("PRAGMA optimize")
+    return "optimize"
+
+def registrar_geracao(con: sqlite3.Connection, versao: str) -> None:
+    """Incrementa a geração da versão a cada importação ou exclusão (validador HTTP da api.py)."""
+    criar_catalogo(con)
+    con.execute("""
+        INSERT INTO geracoes (versao, geracao, data) VALUES (?, 1, ?)
+        ON CONFLICT(versao) DO UPDATE SET geracao=geracao+1, data=excluded.data
+    """, (versao, datetime.now(timezone.utc).isoformat()))
+
+def geracoes(con: sqlite3.Connection) -> dict[str, tuple[int, str]]:
+    """Mapa versão → (geração, data UTC ISO); vazio se não houver catálogo."""
+    try:
+        rows = con.execute("SELECT versao, geracao, data FROM geracoes").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def particoes(con: sqlite3.Connection) -> dict[str, tuple[int, str]]:
+    """Mapa versão → (id, arquivo) das versões particionadas; vazio se não houver catálogo."""
+    try:
+        rows = con.execute("SELECT versao, id, arquivo FROM particoes").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def slug_versao(versao: str) -> str:
+    """Nome de arquivo estável para a versão (slug legível + hash curto contra colisões)."""
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", versao).strip("_") or "versao"
+    h = hashlib.sha1(versao.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}_{h}"
+
+def arquivo_particao(versao: str) -> str:
+    """Nome novo a cada importação: o arquivo em uso só deixa de valer quando o catálogo muda."""
+    return os.path.join(DIR_VERSOES, f"{slug_versao(versao)}.{uuid.uuid4().hex[:8]}.db")
+
+def _alias(pid: int) -> str:
+    return f"p{pid}"
+
+def _anexadas(con: sqlite3.Connection) -> set[str]:
+    return {r[1] for r in con.execute("PRAGMA database_list").fetchall()}
+
+def _arquivo_anexado(con: sqlite3.Connection, alias: str) -> str | None:
+    for r in con.execute("PRAGMA database_list").fetchall():
+        if r[1] == alias:
+            return r[2]
+    return None
+
+def anexar_versao(con: sqlite3.Connection, versao: str) -> str | None:
+    """Anexa (ATTACH) o arquivo da versão sob demanda; retorna o schema ou None se não particionada."""
+    info = particoes(con).get(versao)
+    if info is None:
+        return None
+    pid, arquivo = info
+    alias = _alias(pid)
+    anexadas = _anexadas(con)
+    # Reimportação aponta o catálogo para outro arquivo: o anexo antigo é refeito
+    if alias in anexadas and os.path.abspath(_arquivo_anexado(con, alias) or "") != os.path.abspath(arquivo):
+        con.execute(f"DETACH DATABASE {alias}")
+        anexadas.discard(alias)
+    # Conexões de longa duração (Conexao) lembram qual arquivo anexaram: se a
+    # partição de mesmo nome foi trocada no disco, o anexo antigo é refeito.
+    anexos = getattr(con, "anexos", None)
+    if alias in anexadas and anexos is not None:
+        try:
+            st = os.stat(arquivo)
+            marca = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            marca = None
+        if anexos.get(alias) != marca:
+            con.execute(f"DETACH DATABASE {alias}")
+            anexadas.discard(alias)
+    if alias not in anexadas:
+        if not os.path.exists(arquivo):
+            # ATTACH criaria um arquivo vazio no lugar da partição ausente
+            raise FileNotFoundError(f"Partição da versão '{versao}' não encontrada: {arquivo}")
+        migrar_particao(arquivo)
+        # Respeita SQLITE_MAX_ATTACHED liberando uma partição: em Conexao, a
+        # anexada há mais tempo (anexos guarda a ordem dos ATTACH); nas demais,
+        # a primeira do PRAGMA database_list.
+        outras = [r[1] for r in con.execute("PRAGMA database_list").fetchall() if re.fullmatch(r"p\d+", r[1])]
+        if len(outras) >= limite_anexos(con):
+            ordem = list(anexos) if anexos is not None else []
+            outras.sort(key=lambda a: ordem.index(a) if a in ordem else -1)
+            con.execute(f"DETACH DATABASE {outras[0]}")
+            if anexos is not None:
+                anexos.pop(outras[0], None)
+        con.execute(f"ATTACH DATABASE ? AS {alias}", (arquivo,))
+        if anexos is not None:
+            st = os.stat(arquivo)
+            anexos.pop(alias, None)
+            anexos[alias] = (st.st_ino, st.st_mtime_ns)
+    return alias
+
+def desanexar_versao(con: sqlite3.Connection, versao: str) -> None:
+    info = particoes(con).get(versao)
+    if info is not None and _alias(info[0]) in _anexadas(con):
+        con.execute(f"DETACH DATABASE {_alias(info[0])}")
+
+def tabela_versao(con: sqlite3.Connection, versao: str) -> str:
+    """Tabela que contém a versão: partição anexada ou a tabela única `procedimentos`."""
+    alias = anexar_versao(con, versao)
+    return f"{alias}.procedimentos" if alias else "procedimentos"
+
+def limite_anexos(con: sqlite3.Connection) -> int:
+    """Máximo de bancos anexáveis por conexão (SQLITE_MAX_ATTACHED, 10 por padrão)."""
+    return con.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+def anexar_lote(con: sqlite3.Connection, versoes: list[str]) -> dict[str, str]:
+    """Anexa juntas as partições pedidas (versão → schema), liberando os demais anexos.
+
+    Versões não particionadas são ignoradas; mais partições que `limite_anexos()`
+    levantam ValueError (divida em lotes).
+    """
+    mapa = particoes(con)
+    alvo = [v for v in versoes if v in mapa]
+    if len(alvo) > limite_anexos(con):
+        raise ValueError(f"Máximo de {limite_anexos(con)} partições por lote ({len(alvo)} pedidas).")
+    # Libera anexos que não fazem parte do lote para respeitar o limite
+    manter = {_alias(mapa[v][0]) for v in alvo}
+    for alias in _anexadas(con) - manter - {"main", "temp"}:
+        if re.fullmatch(r"p\d+", alias):
+            con.execute(f"DETACH DATABASE {alias}")
+    return {v: anexar_versao(con, v) for v in alvo}
+
+def listar_versoes(con: sqlite3.Connection) -> list[str]:
+    """Versões da tabela única somadas às do catálogo de partições."""
+    try:
+        unicas = [r[0] for r in con.execute("SELECT DISTINCT versao FROM procedimentos").fetchall()]
+    except sqlite3.OperationalError:
+        unicas = []
+    return sorted(set(unicas) | set(particoes(con)))
+
+def versao_existe(con: sqlite3.Connection, versao: str) -> bool:
+    """Se a versão tem dados, sem varrer as demais (índice idx_proc_ver ou catálogo)."""
+    if versao in particoes(con):
+        return True
+    try:
+        return con.execute("SELECT 1 FROM procedimentos WHERE versao=? LIMIT 1", (versao,)).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+# =====================================================
+# BUSCA EM TODAS AS VERSÕES
+# =====================================================
+def buscar_todas_versoes(con: sqlite3.Connection, termo: str, tipo: str = "codigo",
+                         limite: int = 100, apos: str = "") -> tuple[list[tuple], str | None]:
+    """Linhas (codigo_norm, versao, codigo, descricao, porte, uco, filme) de todas as versões.
+
+    Pagina por código: até `limite` códigos distintos (codigo_norm,
+    chave_codigo) depois do cursor `apos`, cada um com as linhas de todas as
+    versões que o contêm. Por código o filtro é um prefixo em (versao,
+    codigo_norm), com as versões da tabela única num IN; por descrição, LIKE.
+    Partições além de `limite_anexos()` vão em lotes. Retorna (linhas, cursor
+    da próxima página ou None), ordenadas por (codigo_norm, chave_codigo,
+    versao): códigos distintos com os mesmos dígitos ('A1', 'B1') ficam em
+    grupos separados. O cursor é "codigo_norm|chave" e nunca é vazio, nem
+    para códigos sem dígitos; "" pede a primeira página.
+    """
+    if tipo == "codigo":
+        norm = normalizar_codigo(termo)
+        if norm:
+            filtro, fparams = "codigo_norm >= ? AND codigo_norm < ?", [norm, norm[:-1] + chr(ord(norm[-1]) + 1)]
+        elif termo.strip():
+            # Códigos sem dígitos: todos têm codigo_norm vazio
+            filtro, fparams = "codigo_norm = '' AND codigo LIKE ?", [f"%{termo.strip()}%"]
+        else:
+            filtro, fparams = "1", []
+    else:
+        filtro, fparams = "descricao LIKE ?", [f"%{termo}%"]
+    # codigo_norm só tem dígitos: o primeiro '|' separa a chave
+    apos_norm, _, apos_chave = apos.partition("|")
+    if apos:
+        filtro, fparams = f"{filtro} AND codigo_norm >= ?", [*fparams, apos_norm]
+
+    mapa = particoes(con)
+    unicas = [v for v in listar_versoes(con) if v not in mapa]
+    parts = sorted(mapa)
+    n = limite_anexos(con)
+    lotes = [parts[i:i + n] for i in range(0, len(parts), n)] or [[]]
+
+    rows: list[tuple] = []
+    for i, lote in enumerate(lotes):
+        schemas = anexar_lote(con, lote)
+        arms, params = [], []
+        fontes = [("main", unicas)] if i == 0 and unicas else []
+        fontes += [(schemas[v], [v]) for v in lote]
+        for schema, vers in fontes:
+            arms.append(f"""
+                SELECT codigo_norm, versao, codigo, descricao, porte, uco, filme
+                FROM {schema}.procedimentos
+                WHERE versao IN ({",".join("?" * len(vers))}) AND {filtro}""")
+            params += [*vers, *fparams]
+        if not arms:
+            continue
+        rows += con.execute(f"""
+            WITH t AS ({" UNION ALL ".join(arms)})
+            SELECT * FROM t
+            WHERE codigo_norm IN (SELECT DISTINCT codigo_norm FROM t ORDER BY codigo_norm LIMIT ?)
+        """, (*params, limite + 2)).fetchall()
+
+    # +2: o codigo_norm do cursor pode já ter sido todo consumido
+    rows = [(tuple(r), (r[0], chave_codigo(r[2]))) for r in rows]
+    if apos:
+        rows = [(r, g) for r, g in rows if g > (apos_norm, apos_chave)]
+    grupos = sorted({g for _, g in rows})
+    proximo = "|".join(grupos[limite - 1]) if len(grupos) > limite else None
+    pagina = set(grupos[:limite])
+    rows = sorted(((r, g) for r, g in rows if g in pagina), key=lambda x: (x[1], x[0][1], x[0][2]))
+    return [r for r, _ in rows], proximo
+
+# =====================================================
+# ESCRITA PARTICIONADA (arquivo novo + troca atômica)
+# =====================================================
+def importar_particao(con: sqlite3.Connection, versao: str,
+                      registros: list[tuple]) -> tuple[int, str | None]:
+    """Gera um arquivo novo para a versão e aponta o catálogo para ele.
+
+    Linhas já existentes da versão (na partição ou na tabela única) são copiadas
+    para o arquivo novo antes do UPSERT, preservando a semântica de importação
+    incremental. O arquivo anterior não é tocado: a troca vale no commit da
+    transação do catálogo (um rollback mantém o antigo em uso; o novo vira
+    órfão, ver `limpar_particoes_orfas`). Retorna (linhas da partição, arquivo
+    anterior a descartar com `descartar_particao()` depois do commit).
+    FileNotFoundError se o arquivo atual da versão não estiver no disco.
+    """
+    criar_catalogo(con)
+    os.makedirs(DIR_VERSOES, exist_ok=True)
+    info = particoes(con).get(versao)
+    anterior = info[1] if info is not None else None
+    if anterior is not None and not os.path.exists(anterior):
+        # As linhas da versão só existem nesse arquivo: seguir apagaria todas
+        raise FileNotFoundError(f"Partição da versão '{versao}' não encontrada: {anterior}")
+    destino = arquivo_particao(versao)
+    tmp = destino + ".tmp"
+
+    nova = sqlite3.connect(tmp)
+    try:
+        nova.execute(SCHEMA_PROCEDIMENTOS)
+        if anterior is not None:
+            migrar_particao(anterior)
+            nova.execute("ATTACH DATABASE ? AS antiga", (anterior,))
+            nova.execute(f"INSERT INTO main.procedimentos ({COLUNAS}) SELECT {COLUNAS} FROM antiga.procedimentos")
+            nova.commit()
+            nova.execute("DETACH DATABASE antiga")
+        else:
+            existentes = con.execute(f"SELECT {COLUNAS} FROM procedimentos WHERE versao=?", (versao,)).fetchall()
+            nova.executemany(SQL_UPSERT, [tuple(r) for r in existentes])
+        nova.executemany(SQL_UPSERT, com_codigo_norm(nova, registros))
+        nova.execute("CREATE INDEX IF NOT EXISTS idx_proc_desc ON procedimentos (descricao)")
+        nova.execute("CREATE INDEX IF NOT EXISTS idx_proc_ver_norm ON procedimentos (versao, codigo_norm)")
+        # Partição não muda depois de gerada: estatísticas definitivas para o planejador
+        nova.execute("ANALYZE")
+        linhas = nova.execute("SELECT COUNT(*) FROM procedimentos").fetchone()[0]
+        nova.commit()
+    except BaseException:
+        nova.close()
+        descartar_particao(tmp)
+        raise
+    nova.close()
+
+    # Nome novo, ainda fora do catálogo: nenhum leitor o enxerga antes do commit
+    os.replace(tmp, destino)
+    con.execute("""
+        INSERT INTO particoes (versao, arquivo, linhas, data) VALUES (?, ?, ?, ?)
+        ON CONFLICT(versao) DO UPDATE SET arquivo=excluded.arquivo, linhas=excluded.linhas, data=excluded.data
+    """, (versao, destino, linhas, datetime.now().isoformat()))
+    # A versão passa a viver só na partição
+    con.execute("DELETE FROM procedimentos WHERE versao=?", (versao,))
+    return linhas, anterior
+
+def remover_versao(con: sqlite3.Connection, versao: str) -> str | None:
+    """Remove a versão; se particionada, só tira do catálogo e retorna o arquivo.
+
+    O arquivo retornado deve ser apagado com `descartar_particao()` depois do
+    commit, para que um rollback não deixe o catálogo apontando para o nada.
+    """
+    info = particoes(con).get(versao)
+    if info is None:
+        con.execute("DELETE FROM procedimentos WHERE versao=?", (versao,))
+        return None
+    desanexar_versao(con, versao)
+    con.execute("DELETE FROM particoes WHERE versao=?", (versao,))
+    return info[1]
+
+def descartar_particao(arquivo: str) -> None:
+    """Apaga o arquivo de uma partição já removida do catálogo."""
+    for caminho in (arquivo, arquivo + "-journal"):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+def limpar_particoes_orfas(con: sqlite3.Connection) -> list[str]:
+    """Apaga de DIR_VERSOES os arquivos fora do catálogo (importações desfeitas por rollback).
+
+    Deve rodar no escritor, para não concorrer com uma importação em andamento.
+    """
+    if not os.path.isdir(DIR_VERSOES):
+        return []
+    em_uso = {os.path.abspath(arq) for _, arq in particoes(con).values()}
+    orfas = []
+    for nome in os.listdir(DIR_VERSOES):
+        caminho = os.path.join(DIR_VERSOES, nome)
+        if nome.endswith((".db", ".tmp")) and os.path.abspath(caminho) not in em_uso:
+            descartar_particao(caminho)
+            orfas.append(caminho)
+    return orfas
+
+# =====================================================
+# CONEXÕES: LEITORES POR THREAD + ESCRITOR ÚNICO
+# =====================================================
+class Conexao(sqlite3.Connection):
+    """Connection que guarda os arquivos de partição anexados (ver anexar_versao)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.anexos: dict[str, tuple[int, int]] = {}
+
+class GerenciadorConexoes:
+    """Uma conexão de leitura por thread e um único escritor alimentado por fila.
+
+    Em WAL, leitores não bloqueiam o escritor nem uns aos outros; serializar
+    todas as escritas numa só conexão evita transações intercaladas entre
+    sessões e erros de "database is locked".
+    """
+    def __init__(self, caminho: str = DB_NAME, timeout: float = 60):
+        self.caminho = caminho
+        self.timeout = timeout
+        self._local = threading.local()
+        self._fila: queue.Queue = queue.Queue()
+        self._escritor = threading.Thread(target=self._loop_escritor, name="cbhpm-escritor", daemon=True)
+        self._escritor.start()
+
+    def _abrir(self, leitura: bool) -> sqlite3.Connection:
+        con = sqlite3.connect(self.caminho, timeout=self.timeout, factory=Conexao)
+        con.row_factory = sqlite3.Row
+        con.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA foreign_keys=ON;
+            PRAGMA busy_timeout={int(self.timeout * 1000)};
+        """)
+        if leitura:
+            con.execute("PRAGMA query_only=ON")
+        return con
+
+    def leitura(self) -> sqlite3.Connection:
+        """Conexão de leitura exclusiva da thread atual (aberta na primeira chamada)."""
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = self._abrir(leitura=True)
+        return con
+
+    def escrever(self, fn, *args, **kwargs):
+        """Executa fn(con, *args, **kwargs) no escritor, numa transação; devolve o resultado.
+
+        Bloqueia até a escrita terminar; exceções de fn voltam para quem chamou
+        (após o rollback).
+        """
+        if threading.current_thread() is self._escritor:
+            raise RuntimeError("escrever() chamado de dentro de uma escrita.")
+        fut: Future = Future()
+        self._fila.put((fn, args, kwargs, fut))
+        return fut.result()
+
+    def _loop_escritor(self) -> None:
+        con = None
+        while True:
+            item = self._fila.get()
+            if item is None:
+                break
+            fn, args, kwargs, fut = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                if con is None:
+                    con = self._abrir(leitura=False)
+                res = fn(con, *args, **kwargs)
+                con.commit()
+                fut.set_result(res)
+            except BaseException as e:
+                if con is not None:
+                    con.rollback()
+                fut.set_exception(e)
+        if con is not None:
+            con.close()
+
+    def fechar(self) -> None:
+        """Encerra o escritor após as escritas pendentes."""
+        self._fila.put(None)
+        self._escritor.join()
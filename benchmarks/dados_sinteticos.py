@@ -0,0 +1,73 @@
+# CBHPM – gerador de tabelas sintéticas para benchmarks (formatos pt-BR, acentos, CSV/Excel)
+import os
+import random
+
+import pandas as pd
+
+TERMOS = [
+    "Consulta em consultório", "Ressecção", "Biópsia", "Punção", "Anestesia",
+    "Tomografia computadorizada", "Ultrassonografia", "Ressonância magnética",
+    "Cirurgia", "Drenagem", "Reconstrução", "Artroscopia", "Endoscopia", "Exérese",
+]
+REGIOES = [
+    "do fígado", "do pâncreas", "do coração", "do crânio", "da região cervical",
+    "do úmero", "da mão", "do joelho", "do tórax", "do abdômen", "da órbita",
+    "do músculo esquelético", "do tecido ósseo", "da glândula tireóide",
+]
+COMPLEMENTOS = ["", "", "unilateral", "bilateral", "por vídeo", "com contraste", "em criança", "(revisão)"]
+
+def numero_br(v: float) -> str:
+    """1234.5 → '1.234,50' (como nas planilhas de origem)."""
+    s = f"{v:,.2f}"
+    return s.replace(",", "X").replace(".", ",").replace("X", ".")
+
+def gerar_tabela(linhas: int, seed: int = 0) -> pd.DataFrame:
+    """Tabela-base com códigos de 8 dígitos, descrições acentuadas e valores numéricos."""
+    rnd = random.Random(seed)
+    codigos = set()
+    while len(codigos) < linhas:
+        codigos.add(f"{rnd.randint(1, 4)}{rnd.randint(1000000, 9999999)}")
+    dados = []
+    for cod in sorted(codigos):
+        desc = " ".join(p for p in (rnd.choice(TERMOS), rnd.choice(REGIOES), rnd.choice(COMPLEMENTOS)) if p)
+        dados.append({
+            "Código": cod,
+            "Descrição": desc,
+            "Porte": 0.0 if rnd.random() < 0.03 else round(rnd.uniform(5, 3500), 2),
+            "UCO": round(rnd.uniform(0, 80), 2) if rnd.random() < 0.4 else 0.0,
+            "Filme": round(rnd.uniform(0, 12), 2) if rnd.random() < 0.2 else 0.0,
+        })
+    return pd.DataFrame(dados)
+
+def gerar_versoes(linhas: int, versoes: int, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """Versões sucessivas: reajuste de porte, ~2% de códigos removidos e ~2% incluídos por versão."""
+    rnd = random.Random(seed)
+    base = gerar_tabela(linhas, seed)
+    saida = {}
+    for i in range(versoes):
+        nome = f"CBHPM {2010 + 2 * i}"
+        if i > 0:
+            reajuste = 1 + rnd.uniform(0.02, 0.09)
+            base = base.copy()
+            base["Porte"] = (base["Porte"] * reajuste).round(2)
+            base = base.sample(frac=0.98, random_state=seed + i).sort_values("Código")
+            novos = gerar_tabela(max(linhas // 50, 1), seed + 1000 + i)
+            base = pd.concat([base, novos[~novos["Código"].isin(base["Código"])]], ignore_index=True)
+        saida[nome] = base.reset_index(drop=True)
+    return saida
+
+def para_planilha(df: pd.DataFrame) -> pd.DataFrame:
+    """Valores como texto pt-BR, do jeito que chegam nos CSVs exportados do Excel."""
+    out = df.copy()
+    for col in ("Porte", "UCO", "Filme"):
+        out[col] = out[col].map(numero_br)
+    return out
+
+def salvar(df: pd.DataFrame, caminho: str, encoding: str = "utf-8") -> str:
+    """Grava CSV (';', pt-BR) ou .xlsx conforme a extensão do caminho."""
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    if caminho.lower().endswith(".xlsx"):
+        para_planilha(df).to_excel(caminho, index=False)
+    else:
+        para_planilha(df).to_csv(caminho, sep=";", index=False, encoding=encoding)
+    return caminho
@@ -0,0 +1,158 @@
+# CBHPM – estresse de concorrência: leituras em várias threads durante importações
+#
+# Uso:
+#   python -m benchmarks.estresse --leitores 8 --segundos 5 --linhas 20000
+#   python -m benchmarks.estresse --modo compartilhada   # conexão única, como antes
+#
+# Mede leituras/s sem e com uma importação em andamento e conta erros por
+# tipo ("database is locked" incluso). Sai com código 1 se houver erros.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import banco  # noqa: E402
+import negocio  # noqa: E402
+
+VERSAO_BASE = "CBHPM BASE"
+VERSAO_IMPORT = "CBHPM IMPORT"
+
+def registros(versao: str, linhas: int, seed: int) -> list[tuple]:
+    rnd = random.Random(seed)
+    return [(f"{10000000 + i}", f"Procedimento {i} região {rnd.randint(1, 99)}",
+             round(rnd.uniform(5, 3000), 2), 0.0, 0.0, versao) for i in range(linhas)]
+
+class Compartilhada:
+    """Emula o get_connection() antigo: uma conexão para todas as threads, sem trava."""
+    def __init__(self, caminho: str):
+        self.con = sqlite3.connect(caminho, check_same_thread=False, timeout=60)
+        self.con.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;")
+
+    def leitura(self) -> sqlite3.Connection:
+        return self.con
+
+    def escrever(self, fn, *args):
+        try:
+            res = fn(self.con, *args)
+            self.con.commit()
+            return res
+        except Exception:
+            self.con.rollback()
+            raise
+
+    def fechar(self) -> None:
+        self.con.close()
+
+def fase(acesso, leitores: int, segundos: float, codigos: list[str], importar: bool,
+         linhas: int, particionado: bool) -> dict:
+    parar = threading.Event()
+    erros: Counter = Counter()
+    leituras = [0] * leitores
+    escritas = [0]
+    trava = threading.Lock()
+
+    def _erro(e: Exception) -> None:
+        with trava:
+            erros[f"{type(e).__name__}: {e}"[:120]] += 1
+
+    def leitor(i: int) -> None:
+        rnd = random.Random(i)
+        while not parar.is_set():
+            try:
+                con = acesso.leitura()
+                tabela = banco.tabela_versao(con, VERSAO_BASE)
+                con.execute(f"SELECT codigo, descricao, porte FROM {tabela} WHERE codigo = ? AND versao = ?",
+                            (rnd.choice(codigos), VERSAO_BASE)).fetchone()
+                leituras[i] += 1
+            except Exception as e:
+                _erro(e)
+
+    def importador() -> None:
+        n = 0
+        while not parar.is_set():
+            try:
+                acesso.escrever(negocio.gravar_importacao, VERSAO_IMPORT,
+                                registros(VERSAO_IMPORT, linhas, n), [], particionado)
+                acesso.escrever(negocio.remover_versao, VERSAO_IMPORT)
+                escritas[0] += 1
+            except Exception as e:
+                _erro(e)
+            n += 1
+
+    threads = [threading.Thread(target=leitor, args=(i,)) for i in range(leitores)]
+    if importar:
+        threads.append(threading.Thread(target=importador))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(segundos)
+    parar.set()
+    for t in threads:
+        t.join()
+    dur = time.perf_counter() - t0
+    return {
+        "leituras": sum(leituras),
+        "leituras_por_s": sum(leituras) / dur,
+        "importacoes": escritas[0],
+        "erros": dict(erros),
+        "erros_lock": sum(n for k, n in erros.items() if "locked" in k),
+    }
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Estresse de leitura concorrente durante importações")
+    p.add_argument("--modo", choices=["gerenciador", "compartilhada"], default="gerenciador")
+    p.add_argument("--leitores", type=int, default=8)
+    p.add_argument("--segundos", type=float, default=5)
+    p.add_argument("--linhas", type=int, default=20000, help="linhas da versão base e de cada importação")
+    p.add_argument("--particionado", action="store_true")
+    p.add_argument("--saida", help="grava o resultado em JSON")
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cbhpm_estresse_") as tmp:
+        os.chdir(tmp)
+        try:
+            os.makedirs("data", exist_ok=True)
+            con = sqlite3.connect(banco.DB_NAME)
+            con.execute("PRAGMA journal_mode=WAL")
+            banco.criar_tabelas(con)
+            negocio.gravar_importacao(con, VERSAO_BASE, registros(VERSAO_BASE, args.linhas, 0), [], args.particionado)
+            con.commit()
+            con.close()
+            codigos = [f"{10000000 + i}" for i in range(args.linhas)]
+
+            acesso = banco.GerenciadorConexoes(banco.DB_NAME) if args.modo == "gerenciador" else Compartilhada(banco.DB_NAME)
+            resultado = {"parametros": vars(args)}
+            print(f"• {args.modo}: {args.leitores} leitores, sem importação ({args.segundos:.0f}s)")
+            resultado["sem_importacao"] = fase(acesso, args.leitores, args.segundos, codigos, False,
+                                               args.linhas, args.particionado)
+            print(f"• {args.modo}: {args.leitores} leitores, com importações contínuas ({args.segundos:.0f}s)")
+            resultado["com_importacao"] = fase(acesso, args.leitores, args.segundos, codigos, True,
+                                               args.linhas, args.particionado)
+            acesso.fechar()
+        finally:
+            os.chdir(RAIZ)
+
+    for nome in ("sem_importacao", "com_importacao"):
+        r = resultado[nome]
+        print(f"{nome:<16} {r['leituras_por_s']:>10.0f} leituras/s   importações: {r['importacoes']:<4}"
+              f" erros: {sum(r['erros'].values())} (lock: {r['erros_lock']})")
+        for msg, n in r["erros"].items():
+            print(f"    {n:>6} × {msg}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    total_erros = sum(sum(resultado[n]["erros"].values()) for n in ("sem_importacao", "com_importacao"))
+    return 1 if total_erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
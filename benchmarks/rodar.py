@@ -0,0 +1,250 @@
+# CBHPM – benchmarks dos caminhos críticos, sem Streamlit
+#
+# Uso:
+#   python -m benchmarks.rodar --linhas 20000 --versoes 3 --saida bench.json
+#   python -m benchmarks.rodar --comparar bench_anterior.json --tolerancia 0.25
+#
+# Cada caso roda em um diretório temporário (banco e partições isolados) e o
+# resultado é gravado em JSON para comparação entre commits; com --comparar,
+# sai com código 1 se algum caso ficar mais lento que a base além da tolerância.
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import banco  # noqa: E402
+import indice_codigos  # noqa: E402
+import negocio  # noqa: E402
+import sincronizacao  # noqa: E402
+from benchmarks import dados_sinteticos  # noqa: E402
+
+def _commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, text=True).strip()
+    except Exception:
+        return "desconhecido"
+
+def cronometrar(fn, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - t0)
+    return {
+        "mediana_s": statistics.median(tempos),
+        "min_s": min(tempos),
+        "max_s": max(tempos),
+        "repeticoes": repeticoes,
+    }
+
+class Arquivo(BytesIO):
+    """Imita o UploadedFile do Streamlit (BytesIO com `name`) a partir de um caminho."""
+    def __init__(self, caminho: str):
+        with open(caminho, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(caminho)
+
+def criar_banco(caminho: str) -> sqlite3.Connection:
+    con = sqlite3.connect(caminho)
+    con.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;")
+    banco.criar_tabelas(con)
+    con.commit()
+    return con
+
+def importar(con: sqlite3.Connection, arquivos: dict[str, str], particionado: bool) -> None:
+    """Mesmo fluxo de app.importar(): leitura, extração e gravação, um commit por versão."""
+    for versao, caminho in arquivos.items():
+        df = negocio.ler_arquivo(Arquivo(caminho))
+        registros, _ = negocio.extrair_registros(df, versao)
+        _, anterior = negocio.gravar_importacao(con, versao, registros, [], particionado)
+        con.commit()
+        if anterior:
+            banco.descartar_particao(anterior)
+
+def executar(args) -> dict:
+    resultados = {}
+    rnd = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="cbhpm_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            os.makedirs("data", exist_ok=True)
+            tabelas = dados_sinteticos.gerar_versoes(args.linhas, args.versoes, args.seed)
+            ext = ".xlsx" if args.formato == "xlsx" else ".csv"
+            arquivos = {
+                v: dados_sinteticos.salvar(df, os.path.join("entrada", f"{v}{ext}"), args.encoding)
+                for v, df in tabelas.items()
+            }
+
+            def _importar():
+                for f in os.listdir("data"):
+                    if f.endswith((".db", "-wal", "-shm")):
+                        os.remove(os.path.join("data", f))
+                if os.path.isdir(banco.DIR_VERSOES):
+                    for f in os.listdir(banco.DIR_VERSOES):
+                        os.remove(os.path.join(banco.DIR_VERSOES, f))
+                con = criar_banco(banco.DB_NAME)
+                importar(con, arquivos, args.particionado)
+                con.close()
+
+            print(f"• importar ({args.versoes} versões × ~{args.linhas} linhas, {args.formato})")
+            resultados["importar"] = cronometrar(_importar, args.repeticoes)
+
+            con = sqlite3.connect(banco.DB_NAME, check_same_thread=False)
+            versoes = banco.listar_versoes(con)
+            v1, v2 = versoes[0], versoes[-1]
+            codigos = rnd.sample(list(tabelas[v2]["Código"]), min(args.consultas, len(tabelas[v2])))
+            termos = [rnd.choice(dados_sinteticos.REGIOES).split()[-1] for _ in range(max(args.consultas // 10, 1))]
+
+            print(f"• buscar_dados por código ({len(codigos)} consultas)")
+            resultados["buscar_codigo"] = cronometrar(
+                lambda: [negocio.buscar_dados(con, c, v2, "Código") for c in codigos], args.repeticoes)
+
+            n_todas = max(args.consultas // 10, 1)
+            # Busca exata: SQLite (índice B-tree) × índice mmap da versão
+            tabela = banco.tabela_versao(con, v2)
+            print(f"• sqlite por código exato ({len(codigos)} consultas)")
+            resultados["sqlite_procedimento"] = cronometrar(
+                lambda: [con.execute(f"SELECT codigo, descricao, porte, uco, filme FROM {tabela}"
+                                     " WHERE versao = ? AND codigo_norm = ?", (v2, c)).fetchone() for c in codigos],
+                args.repeticoes)
+            geracao = banco.geracoes(con)[v2][0]
+            indice_codigos.garantir(con, v2, geracao)
+            print(f"• índice mmap por código exato ({len(codigos)} consultas)")
+            resultados["indice_procedimento"] = cronometrar(
+                lambda: [indice_codigos.garantir(con, v2, geracao).buscar(c) for c in codigos], args.repeticoes)
+
+            print(f"• busca em todas as versões por código ({n_todas} consultas)")
+            resultados["buscar_todas_versoes"] = cronometrar(
+                lambda: [banco.buscar_todas_versoes(con, c, "codigo") for c in codigos[:n_todas]], args.repeticoes)
+
+            print(f"• buscar_dados por descrição ({len(termos)} consultas)")
+            resultados["buscar_descricao"] = cronometrar(
+                lambda: [negocio.buscar_dados(con, t, v2, "Descrição") for t in termos], args.repeticoes)
+
+            print(f"• comparar {v1} × {v2}")
+            resultados["comparar"] = cronometrar(
+                lambda: negocio.comparar_versoes(negocio.dados_versao(con, v1), negocio.dados_versao(con, v2)),
+                args.repeticoes)
+
+            print("• exportar Excel")
+            resultados["exportar_excel"] = cronometrar(lambda: negocio.gerar_backup_excel(con), args.repeticoes)
+
+            print("• snapshot do banco para sincronização (VACUUM INTO)")
+            resultados["snapshot"] = cronometrar(
+                lambda: os.remove(sincronizacao.gerar_snapshot(banco.DB_NAME)), args.repeticoes)
+
+            try:
+                import api
+                from fastapi.testclient import TestClient  # requer httpx
+            except ImportError as e:
+                print(f"• api.py ignorada ({e})")
+            else:
+                api.DB_NAME = os.path.abspath(banco.DB_NAME)
+                cliente = TestClient(api.app)
+                n = max(args.consultas // 10, 1)
+                print("• api /versoes")
+                resultados["api_versoes"] = cronometrar(
+                    lambda: [cliente.get("/versoes") for _ in range(n)], args.repeticoes)
+                print(f"• api /procedimento ({len(codigos)} consultas)")
+                resultados["api_procedimento"] = cronometrar(
+                    lambda: [cliente.get("/procedimento", params={"codigo": c, "versao": v2}) for c in codigos],
+                    args.repeticoes)
+                etags = {c: cliente.get("/procedimento", params={"codigo": c, "versao": v2}).headers.get("etag")
+                         for c in codigos}
+                print(f"• api /procedimento condicional, 304 ({len(codigos)} consultas)")
+                resultados["api_procedimento_304"] = cronometrar(
+                    lambda: [cliente.get("/procedimento", params={"codigo": c, "versao": v2},
+                                         headers={"If-None-Match": etags[c]}) for c in codigos],
+                    args.repeticoes)
+                print(f"• api /busca em todas as versões ({n_todas} consultas)")
+                resultados["api_busca"] = cronometrar(
+                    lambda: [cliente.get("/busca", params={"termo": c}) for c in codigos[:n_todas]], args.repeticoes)
+
+                print("• api /procedimentos (paginação completa) e /versoes/{versao}/export")
+                def _paginar():
+                    after = ""
+                    while after is not None:
+                        after = cliente.get("/procedimentos", params={"versao": v2, "after": after,
+                                                                      "limit": 1000}).json()["proximo"]
+                resultados["api_paginacao"] = cronometrar(_paginar, args.repeticoes)
+                resultados["api_export_ndjson"] = cronometrar(
+                    lambda: cliente.get(f"/versoes/{v2}/export").content, args.repeticoes)
+
+            con.close()
+        finally:
+            os.chdir(RAIZ)
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "data": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "parametros": vars(args),
+        },
+        "resultados": resultados,
+    }
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list[str]:
+    """Casos cuja mediana piorou além da tolerância em relação à base."""
+    regressoes = []
+    print(f"\n{'caso':<20}{'base (s)':>12}{'atual (s)':>12}{'razão':>8}")
+    for nome, r in atual["resultados"].items():
+        b = base.get("resultados", {}).get(nome)
+        if not b:
+            print(f"{nome:<20}{'—':>12}{r['mediana_s']:>12.4f}{'—':>8}")
+            continue
+        razao = r["mediana_s"] / b["mediana_s"] if b["mediana_s"] else float("inf")
+        marca = "  ⚠" if razao > 1 + tolerancia else ""
+        print(f"{nome:<20}{b['mediana_s']:>12.4f}{r['mediana_s']:>12.4f}{razao:>8.2f}{marca}")
+        if marca:
+            regressoes.append(nome)
+    return regressoes
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmarks CBHPM (importar, buscar, comparar, exportar, api)")
+    p.add_argument("--linhas", type=int, default=5000, help="linhas por versão")
+    p.add_argument("--versoes", type=int, default=3)
+    p.add_argument("--formato", choices=["csv", "xlsx"], default="csv")
+    p.add_argument("--encoding", default="utf-8", help="encoding dos CSVs gerados (ex.: latin-1)")
+    p.add_argument("--particionado", action="store_true", help="importa no layout particionado")
+    p.add_argument("--consultas", type=int, default=200, help="consultas por caso de busca")
+    p.add_argument("--repeticoes", type=int, default=3)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--saida", default="bench_resultados.json")
+    p.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    p.add_argument("--tolerancia", type=float, default=0.25, help="piora relativa aceita (0.25 = 25%%)")
+    args = p.parse_args(argv)
+
+    saida = os.path.abspath(args.saida)
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+
+    resultado = executar(args)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {saida}")
+
+    if base is not None:
+        regressoes = comparar(resultado, base, args.tolerancia)
+        if regressoes:
+            print(f"Regressões acima de {args.tolerancia:.0%}: {', '.join(regressoes)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# CBHPM – verificação do download em streaming contra um servidor HTTP local
+#
+# Uso:
+#   python -m benchmarks.verificar_download
+#
+# Sobe um http.server numa porta livre, serve bancos SQLite (puro, gzip, em
+# modo WAL, truncados) e confere que sincronizacao.baixar_arquivo só substitui
+# o destino quando tudo bate, sem deixar temporários (.part, -wal, -shm) para
+# trás. Sai com código 1 se algum caso falhar.
+import gzip
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import sincronizacao  # noqa: E402
+
+ORIGINAL = b"conteudo anterior"
+
+def criar_banco(caminho: str, wal: bool = False) -> bytes:
+    con = sqlite3.connect(caminho)
+    if wal:
+        con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE procedimentos (codigo TEXT, descricao TEXT, porte REAL)")
+    con.executemany("INSERT INTO procedimentos VALUES (?, ?, ?)",
+                    [(f"{10000000 + i}", f"Procedimento {i} ção", i * 1.5) for i in range(2000)])
+    con.commit()
+    if wal:
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+    with open(caminho, "rb") as f:
+        return f.read()
+
+def sha1_git(dados: bytes) -> str:
+    return hashlib.sha1(f"blob {len(dados)}\0".encode() + dados).hexdigest()
+
+class Servidor(BaseHTTPRequestHandler):
+    """GET /<nome> devolve ROTAS[nome] = (status, corpo); 'falhas' conta 503s antes do 200."""
+    rotas: dict[str, tuple[int, bytes]] = {}
+    falhas: dict[str, int] = {}
+
+    def do_GET(self):
+        nome = self.path.lstrip("/").split("?")[0]
+        if self.falhas.get(nome):
+            self.falhas[nome] -= 1
+            status, corpo = 503, b""
+        else:
+            status, corpo = self.rotas.get(nome, (404, b""))
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="cbhpm_download_") as tmp:
+        puro = criar_banco(os.path.join(tmp, "puro.db"))
+        wal = criar_banco(os.path.join(tmp, "wal.db"), wal=True)
+        comp = gzip.compress(puro)
+        Servidor.rotas = {
+            "puro": (200, puro),
+            "gzip": (200, comp),
+            "wal": (200, wal),
+            "retry": (200, puro),
+            "truncado": (200, puro[:len(puro) // 2]),
+            "gzip_truncado": (200, comp[:len(comp) // 2]),
+            "lixo": (200, b"nao e sqlite" * 100),
+        }
+        Servidor.falhas = {"retry": 1}
+        srv = ThreadingHTTPServer(("127.0.0.1", 0), Servidor)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{srv.server_port}"
+
+        pasta = os.path.join(tmp, "data")
+        os.makedirs(pasta)
+        destino = os.path.join(pasta, "cbhpm_database.db")
+
+        # (nome, rota, kwargs, deve_falhar, bytes esperados no destino)
+        casos = [
+            ("puro com tamanho e sha do git", "puro", {"tamanho": len(puro), "sha1_git": sha1_git(puro)}, False, puro),
+            ("gzip descompactado no download", "gzip",
+             {"compressao": "gzip", "tamanho": len(comp), "sha1_git": sha1_git(comp)}, False, puro),
+            ("banco em modo WAL", "wal", {"tamanho": len(wal)}, False, wal),
+            ("503 transitório e nova tentativa", "retry", {"tamanho": len(puro)}, False, puro),
+            ("tamanho errado", "puro", {"tamanho": len(puro) + 1}, True, ORIGINAL),
+            ("sha do git errado", "puro", {"tamanho": len(puro), "sha1_git": "0" * 40}, True, ORIGINAL),
+            ("truncado com tamanho do repositório", "truncado", {"tamanho": len(puro)}, True, ORIGINAL),
+            ("truncado sem tamanho (integrity_check)", "truncado", {}, True, ORIGINAL),
+            ("gzip truncado", "gzip_truncado", {"compressao": "gzip"}, True, ORIGINAL),
+            ("gzip errado para arquivo puro", "puro", {"compressao": "gzip"}, True, ORIGINAL),
+            ("não é SQLite", "lixo", {}, True, ORIGINAL),
+            ("404", "ausente", {}, True, ORIGINAL),
+        ]
+        falhas = 0
+        for nome, rota, kwargs, deve_falhar, esperado in casos:
+            with open(destino, "wb") as f:
+                f.write(ORIGINAL)
+            erro = None
+            try:
+                sincronizacao.baixar_arquivo(f"{base}/{rota}", destino, retries=1, **kwargs)
+            except sincronizacao.ErroDownload as e:
+                erro = e
+            with open(destino, "rb") as f:
+                atual = f.read()
+            sobras = sorted(set(os.listdir(pasta)) - {"cbhpm_database.db"})
+            ok = (erro is not None) == deve_falhar and atual == esperado and not sobras
+            falhas += not ok
+            detalhe = f" ({erro})" if erro else ""
+            print(f"{'ok ' if ok else 'FALHOU'} {nome}{detalhe}" + (f" sobras: {sobras}" if sobras else ""))
+        srv.shutdown()
+    print(f"\n{len(casos) - falhas}/{len(casos)} casos ok")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# CBHPM – índice ordenado de códigos em arquivo, compartilhado via mmap entre processos
+#
+# Layout (little-endian), um arquivo por versão em data/indices:
+#   cabeçalho  "<8sQIIQQ": MAGIA, geração da versão, n, largura da chave K,
+#              bytes das descrições, bytes dos códigos originais
+#   chaves     n × K bytes (codigo_norm completado com \0, ordenado)
+#   (padding até múltiplo de 8)
+#   porte, uco, filme   3 × n float64
+#   offsets    (n + 1) uint32 para o blob de descrições
+#   offsets    (n + 1) uint32 para o blob de códigos (como importados)
+#   descrições e códigos UTF-8 concatenados
+#
+# O arquivo é só leitura depois de gerado: cada worker do uvicorn faz mmap e
+# o sistema compartilha as páginas, sem cópia por processo. A troca é atômica
+# (temporário + os.replace); leitores percebem pela identidade do arquivo.
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+
+import banco
+
+DIR_INDICES = "data/indices"
+MAGIA = b"CBHPMIX2"
+CABECALHO = struct.Struct("<8sQIIQQ")
+
+def arquivo_indice(versao: str) -> str:
+    return os.path.join(DIR_INDICES, f"{banco.slug_versao(versao)}.idx")
+
+# =====================================================
+# CONSTRUÇÃO
+# =====================================================
+def construir(con: sqlite3.Connection, versao: str, geracao: int = 0) -> str:
+    """Gera o índice da versão a partir do banco e o troca atomicamente; retorna o caminho."""
+    tabela = banco.tabela_versao(con, versao)
+    rows = con.execute(f"""
+        SELECT codigo_norm, descricao, porte, uco, filme, codigo
+        FROM {tabela}
+        WHERE versao = ?
+    """, (versao,)).fetchall()
+    chaves = [str(r[0]).encode("utf-8") for r in rows]
+    # Empate de chave (mesmos dígitos): ordenados pelo código original, varridos em buscar()
+    ordem = sorted(range(len(rows)), key=lambda i: (chaves[i], str(rows[i][5])))
+    n = len(rows)
+    k = max([1, *(len(c) for c in chaves)])
+
+    porte, uco, filme = array("d"), array("d"), array("d")
+    offsets, offsets_cod = array("I", [0]), array("I", [0])
+    descricoes, codigos = bytearray(), bytearray()
+    blob_chaves = bytearray()
+    for i in ordem:
+        r = rows[i]
+        blob_chaves += chaves[i].ljust(k, b"\0")
+        porte.append(float(r[2] or 0))
+        uco.append(float(r[3] or 0))
+        filme.append(float(r[4] or 0))
+        descricoes += str(r[1]).encode("utf-8")
+        offsets.append(len(descricoes))
+        codigos += str(r[5]).encode("utf-8")
+        offsets_cod.append(len(codigos))
+    if sys.byteorder != "little":
+        for a in (porte, uco, filme, offsets, offsets_cod):
+            a.byteswap()
+
+    destino = arquivo_indice(versao)
+    os.makedirs(DIR_INDICES, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=DIR_INDICES, prefix=".indice_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(CABECALHO.pack(MAGIA, geracao, n, k, len(descricoes), len(codigos)))
+            f.write(blob_chaves)
+            f.write(b"\0" * (-(CABECALHO.size + len(blob_chaves)) % 8))
+            for a in (porte, uco, filme, offsets, offsets_cod):
+                a.tofile(f)
+            f.write(descricoes)
+            f.write(codigos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, destino)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return destino
+
+def remover(versao: str) -> None:
+    try:
+        os.remove(arquivo_indice(versao))
+    except FileNotFoundError:  # já removido (por outro worker, inclusive)
+        pass
+
+# =====================================================
+# LEITURA (mmap + busca binária)
+# =====================================================
+class IndiceCodigos:
+    """Índice de uma versão mapeado em memória; buscar() é uma busca binária nas chaves."""
+    def __init__(self, caminho: str):
+        with open(caminho, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.identidade = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIA)] != MAGIA or len(self._mm) < CABECALHO.size:
+            self._mm.close()
+            raise ValueError(f"Arquivo de índice inválido: {caminho}")
+        _, self.geracao, self.n, self.k, tam_desc, _ = CABECALHO.unpack_from(self._mm, 0)
+        self._chaves = CABECALHO.size
+        fim_chaves = self._chaves + self.n * self.k
+        self._porte = fim_chaves + (-fim_chaves % 8)
+        self._uco = self._porte + 8 * self.n
+        self._filme = self._uco + 8 * self.n
+        self._offsets = self._filme + 8 * self.n
+        self._offsets_cod = self._offsets + 4 * (self.n + 1)
+        self._descricoes = self._offsets_cod + 4 * (self.n + 1)
+        self._codigos = self._descricoes + tam_desc
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _posicao(self, codigo: str) -> int:
+        """Primeira posição com os mesmos dígitos do código, ou -1."""
+        alvo = banco.normalizar_codigo(codigo).encode("utf-8")
+        if len(alvo) > self.k:
+            return -1
+        alvo = alvo.ljust(self.k, b"\0")
+        mm, base, k = self._mm, self._chaves, self.k
+        lo, hi = 0, self.n
+        while lo < hi:
+            meio = (lo + hi) // 2
+            ini = base + meio * k
+            if mm[ini:ini + k] < alvo:
+                lo = meio + 1
+            else:
+                hi = meio
+        if lo < self.n and mm[base + lo * k:base + (lo + 1) * k] == alvo:
+            return lo
+        return -1
+
+    def buscar(self, codigo: str) -> dict | None:
+        """Registro do código em qualquer formatação ({codigo, descricao, porte, uco, filme}) ou None."""
+        i = self._posicao(codigo)
+        if i < 0:
+            return None
+        mm, k, base = self._mm, self.k, self._chaves
+        chave = banco.chave_codigo(codigo)
+        # Códigos diferentes com os mesmos dígitos ('A1', 'B1') ficam lado a lado
+        while True:
+            ini_c, fim_c = struct.unpack_from("<II", mm, self._offsets_cod + 4 * i)
+            original = mm[self._codigos + ini_c:self._codigos + fim_c].decode("utf-8")
+            if banco.chave_codigo(original) == chave:
+                break
+            i += 1
+            if i >= self.n or mm[base + i * k:base + (i + 1) * k] != mm[base + (i - 1) * k:base + i * k]:
+                return None
+        ini_d, fim_d = struct.unpack_from("<II", mm, self._offsets + 4 * i)
+        return {
+            "codigo": original,
+            "descricao": mm[self._descricoes + ini_d:self._descricoes + fim_d].decode("utf-8"),
+            "porte": struct.unpack_from("<d", mm, self._porte + 8 * i)[0],
+            "uco": struct.unpack_from("<d", mm, self._uco + 8 * i)[0],
+            "filme": struct.unpack_from("<d", mm, self._filme + 8 * i)[0],
+        }
+
+    def fechar(self) -> None:
+        self._mm.close()
+
+_abertos: dict[str, IndiceCodigos] = {}
+_trava = threading.Lock()
+
+def abrir(versao: str) -> IndiceCodigos | None:
+    """Índice da versão (cache por processo, reaberto se o arquivo foi trocado); None se não existe."""
+    caminho = arquivo_indice(versao)
+    try:
+        st = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    identidade = (st.st_ino, st.st_mtime_ns, st.st_size)
+    idx = _abertos.get(caminho)
+    if idx is not None and idx.identidade == identidade:
+        return idx
+    with _trava:
+        idx = _abertos.get(caminho)
+        if idx is None or idx.identidade != identidade:
+            # O mmap antigo não é fechado aqui: outra thread pode estar lendo dele
+            idx = _abertos[caminho] = IndiceCodigos(caminho)
+    return idx
+
+def garantir(con: sqlite3.Connection, versao: str, geracao: int) -> IndiceCodigos:
+    """Índice atualizado para a geração pedida, (re)construindo-o se ausente ou desatualizado."""
+    try:
+        idx = abrir(versao)
+    except ValueError:  # formato antigo: reconstrói
+        idx = None
+    if idx is None or idx.geracao != geracao:
+        construir(con, versao, geracao)
+        idx = abrir(versao)
+    return idx
@@ -0,0 +1,243 @@
+# CBHPM – lógica de negócio sem Streamlit (leitura de arquivos, busca, comparação, exportação)
+import csv
+import sqlite3
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+import banco
+
+# Colunas aceitas na importação, por campo
+MAPA_COLUNAS = {
+    "codigo": ["Código", "Codigo"],
+    "descricao": ["Descrição", "Descricao"],
+    "porte": ["Porte"],
+    "uco": ["UCO", "CH"],
+    "filme": ["Filme"]
+}
+
+# =====================================================
+# UTILITÁRIOS
+# =====================================================
+def sanitize_str(x) -> str:
+    return str(x).strip()
+
+def to_float(v) -> float:
+    if pd.isna(v) or v == "":
+        return 0.0
+    if isinstance(v, str):
+        v = v.replace(".", "").replace(",", ".").strip()
+    try:
+        return float(v)
+    except:
+        return 0.0
+
+def extrair_valor(row, df: pd.DataFrame, col_opts: list[str]) -> float:
+    for c in col_opts:
+        if c in df.columns:
+            return to_float(row[c])
+    return 0.0
+
+def read_csv_smart(file) -> pd.DataFrame:
+    """Detecta BOM, encoding e delimitador de forma robusta para CSV."""
+    file.seek(0)
+    content = file.read()
+    # Remove BOM, se existir
+    if content.startswith(b"\xef\xbb\xbf"):
+        content = content[3:]
+    # Tenta encodings comuns
+    for enc in ("utf-8", "latin-1"):
+        try:
+            sample_str = content[:2048].decode(enc)
+            sep = csv.Sniffer().sniff(sample_str, delimiters=[",", ";", "\t", "|"]).delimiter
+            return pd.read_csv(BytesIO(content), sep=sep, encoding=enc)
+        except Exception:
+            continue
+    # Fallback
+    return pd.read_csv(BytesIO(content), sep=";", encoding="latin-1")
+
+# =====================================================
+# IMPORTAÇÃO
+# =====================================================
+def ler_arquivo(arq) -> pd.DataFrame:
+    """Leitura robusta (CSV/Excel) de um arquivo com atributo `name` (ex.: UploadedFile)."""
+    if arq.name.lower().endswith(".csv"):
+        df = read_csv_smart(arq)
+    elif arq.name.lower().endswith(".xls"):
+        df = pd.read_excel(arq, engine="xlrd")
+    else:  # .xlsx
+        try:
+            df = pd.read_excel(arq, engine="openpyxl")
+        except Exception:
+            df = pd.read_excel(arq)  # fallback
+    # Normaliza cabeçalhos
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+def extrair_registros(df: pd.DataFrame, versao: str) -> tuple[list[tuple], int] | None:
+    """Converte o DataFrame em tuplas para UPSERT; None se faltar Código/Descrição.
+
+    Retorna (registros, linhas puladas por código ou descrição vazios).
+    """
+    cod_col = next((c for c in MAPA_COLUNAS["codigo"] if c in df.columns), None)
+    desc_col = next((c for c in MAPA_COLUNAS["descricao"] if c in df.columns), None)
+    if cod_col is None or desc_col is None:
+        return None
+
+    dados_lista = []
+    pulados = 0
+    for _, row in df.iterrows():
+        d = {campo: extrair_valor(row, df, cols) for campo, cols in MAPA_COLUNAS.items()}
+        cod = sanitize_str(row[cod_col])
+        desc = sanitize_str(row[desc_col])
+        if not cod or not desc:
+            pulados += 1
+            continue
+        dados_lista.append((cod, desc, d["porte"], d["uco"], d["filme"], versao))
+    return dados_lista, pulados
+
+def gravar_importacao(con: sqlite3.Connection, versao: str, registros: list[tuple],
+                      hashes: list[str], particionado: bool = False) -> tuple[bool, str | None]:
+    """Grava registros e hashes de uma importação na mesma transação.
+
+    Retorna (foi para partição, arquivo de partição substituído a descartar após o commit).
+    """
+    # Versão já particionada continua no próprio arquivo mesmo com o layout desligado
+    particionar = particionado or versao in banco.particoes(con)
+    anterior = None
+    if particionar:
+        # Arquivo novo da versão; passa a valer no commit do catálogo
+        _, anterior = banco.importar_particao(con, versao, registros)
+    else:
+        banco.gravar_registros(con, registros)
+    con.executemany("INSERT OR IGNORE INTO arquivos_importados (hash, versao, data) VALUES (?, ?, ?)",
+                    [(h, versao, datetime.now().isoformat()) for h in hashes])
+    banco.registrar_geracao(con, versao)
+    return particionar, anterior
+
+def remover_versao(con: sqlite3.Connection, versao: str) -> str | None:
+    """Exclui a versão e seus arquivos importados; retorna a partição a descartar após o commit."""
+    arquivo = banco.remover_versao(con, versao)
+    banco.registrar_geracao(con, versao)
+    con.execute("DELETE FROM arquivos_importados WHERE versao=?", (versao,))
+    return arquivo
+
+# =====================================================
+# CONSULTA, COMPARAÇÃO E EXPORTAÇÃO
+# =====================================================
+def buscar_dados(con: sqlite3.Connection, termo: str, versao: str, tipo: str) -> pd.DataFrame:
+    """Busca na versão; por código usa a chave canônica (exato, senão prefixo), por descrição LIKE.
+
+    Códigos sem dígitos não entram no índice de dígitos: são buscados por LIKE entre eles.
+    """
+    tabela = banco.tabela_versao(con, versao)
+    sql = f"SELECT codigo, descricao, porte, uco, filme FROM {tabela} WHERE versao = ? AND "
+    if tipo != "Código":
+        return pd.read_sql(sql + "descricao LIKE ? ORDER BY codigo", con, params=(versao, f"%{termo}%"))
+    if not termo.strip():
+        return pd.read_sql(sql + "1 ORDER BY codigo", con, params=(versao,))
+    norm = banco.normalizar_codigo(termo)
+    if not norm:
+        return pd.read_sql(sql + "codigo_norm = '' AND codigo LIKE ? ORDER BY codigo", con,
+                           params=(versao, f"%{termo.strip()}%"))
+    # Ambos pelo índice (versao, codigo_norm)
+    df = pd.read_sql(sql + "codigo_norm = ? ORDER BY codigo", con, params=(versao, norm))
+    # Mesmos dígitos, códigos diferentes ('A1' × 'B1'): fica o que bate com o digitado
+    exatos = df[df["codigo"].map(banco.chave_codigo) == banco.chave_codigo(termo)]
+    if not exatos.empty:
+        df = exatos.reset_index(drop=True)
+    if df.empty:
+        fim = norm[:-1] + chr(ord(norm[-1]) + 1)
+        df = pd.read_sql(sql + "codigo_norm >= ? AND codigo_norm < ? ORDER BY codigo_norm",
+                         con, params=(versao, norm, fim))
+    return df
+
+def buscar_codigo(con: sqlite3.Connection, codigo: str, versao: str) -> dict | None:
+    """Registro do código em qualquer formatação (pontos, hífens, espaços); None se ausente."""
+    rows = con.execute(f"""
+        SELECT codigo, descricao, porte, uco, filme
+        FROM {banco.tabela_versao(con, versao)}
+        WHERE versao = ? AND codigo_norm = ?
+        ORDER BY codigo
+    """, (versao, banco.normalizar_codigo(codigo))).fetchall()
+    chave = banco.chave_codigo(codigo)
+    r = next((r for r in rows if banco.chave_codigo(r[0]) == chave), None)
+    return dict(zip(["codigo", "descricao", "porte", "uco", "filme"], r)) if r else None
+
+def dados_versao(con: sqlite3.Connection, versao: str) -> pd.DataFrame:
+    """Versão inteira com codigo_norm e a chave do código, base da comparação entre versões."""
+    df = pd.read_sql(
+        f"""
+        SELECT codigo, codigo_norm, descricao, porte, uco, filme
+        FROM {banco.tabela_versao(con, versao)}
+        WHERE versao = ?
+        ORDER BY codigo_norm
+        """,
+        con, params=(versao,)
+    )
+    df["chave"] = df["codigo"].map(banco.chave_codigo)
+    return df
+
+def buscar_todas_versoes(con: sqlite3.Connection, termo: str, tipo: str, limite: int = 100,
+                         apos: str = "", campos: tuple[str, ...] = ("porte",)) -> tuple[pd.DataFrame, str | None]:
+    """Busca em todas as versões, uma linha por código com os `campos` de cada versão lado a lado.
+
+    Retorna (tabela, cursor da próxima página ou None); ver banco.buscar_todas_versoes.
+    """
+    rows, proximo = banco.buscar_todas_versoes(con, termo, "codigo" if tipo == "Código" else "descricao",
+                                               limite, apos)
+    df = pd.DataFrame(rows, columns=["codigo_norm", "versao", "codigo", "descricao", "porte", "uco", "filme"])
+    if df.empty:
+        return pd.DataFrame(columns=["codigo", "descricao", "versoes"]), proximo
+    df["chave"] = df["codigo"].map(banco.chave_codigo)
+    grupos = df.groupby(["codigo_norm", "chave"], sort=True)
+    largo = pd.DataFrame({
+        "codigo": grupos["codigo"].first(),
+        # Descrição da última versão, em ordem alfabética do nome (a das colunas),
+        # que contém o código; não é a ordem cronológica das edições
+        "descricao": grupos["descricao"].last(),
+        "versoes": grupos["versao"].nunique(),
+    })
+    valores = df.drop_duplicates(["codigo_norm", "chave", "versao"]).pivot(
+        index=["codigo_norm", "chave"], columns="versao", values=list(campos))
+    for v in sorted(df["versao"].unique()):
+        for c in campos:
+            largo[f"{c} {v}" if len(campos) > 1 else v] = valores[(c, v)]
+    return largo.reset_index(drop=True), proximo
+
+def comparar_versoes(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
+    """Junta duas versões pela chave canônica do código; var_porte é NaN quando o porte base é 0."""
+    df2 = df2.rename(
+        columns={"codigo": "codigo_2", "porte": "porte_2", "uco": "uco_2", "filme": "filme_2", "descricao": "desc_2"}
+    )
+    comp = df1.merge(df2, on=["codigo_norm", "chave"])
+    if not comp.empty:
+        base = comp['porte']
+        comp['var_porte'] = ((comp['porte_2'] - base) / base.replace(0, pd.NA)) * 100
+    return comp
+
+def gerar_backup_excel(con: sqlite3.Connection) -> bytes:
+    """Planilha com procedimentos (todas as versões) e arquivos importados, colunas autoajustadas."""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df1 = pd.read_sql("SELECT * FROM procedimentos", con)
+        # Versões particionadas: lidas arquivo a arquivo (limite de ATTACH do SQLite)
+        for v in banco.particoes(con):
+            df_v = pd.read_sql(f"SELECT * FROM {banco.tabela_versao(con, v)}", con)
+            df1 = pd.concat([df1, df_v], ignore_index=True)
+        df2 = pd.read_sql("SELECT * FROM arquivos_importados", con)
+
+        df1.to_excel(writer, index=False, sheet_name="procedimentos")
+        df2.to_excel(writer, index=False, sheet_name="arquivos_importados")
+
+        # autoajuste de colunas
+        for sheet_name, df in [("procedimentos", df1), ("arquivos_importados", df2)]:
+            ws = writer.sheets[sheet_name]
+            for i, col in enumerate(df.columns):
+                try:
+                    max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
+                except Exception:
+                    max_len = len(col) + 2
+                ws.set_column(i, i, min(max_len, 40))
+    return output.getvalue()
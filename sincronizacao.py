@@ -0,0 +1,201 @@
+# CBHPM – transferência do banco com o repositório remoto (sem Streamlit)
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+
+import requests
+
+try:  # opcional: só necessário para arquivos .zst
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK = 1024 * 1024
+ERROS_DESCOMPRESSAO = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+EXTENSOES = {"gzip": ".gz", "zstd": ".zst"}
+
+class ErroDownload(Exception):
+    """Download incompleto, corrompido ou que não passou na verificação."""
+
+# =====================================================
+# COMPRESSÃO
+# =====================================================
+def _descompressor(compressao: str | None):
+    """Objeto com .decompress(bytes) para o formato pedido (None = sem compressão)."""
+    if not compressao:
+        return None
+    if compressao == "gzip":
+        return zlib.decompressobj(wbits=31)
+    if compressao == "zstd":
+        if zstandard is None:
+            raise ErroDownload("Pacote 'zstandard' não instalado; necessário para arquivos .zst.")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Compressão desconhecida: {compressao}")
+
+def comprimir(dados: bytes, compressao: str | None) -> bytes:
+    if not compressao:
+        return dados
+    if compressao == "gzip":
+        return gzip.compress(dados, compresslevel=6)
+    if compressao == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Pacote 'zstandard' não instalado; necessário para arquivos .zst.")
+        return zstandard.ZstdCompressor(level=10).compress(dados)
+    raise ValueError(f"Compressão desconhecida: {compressao}")
+
+# =====================================================
+# VERIFICAÇÕES
+# =====================================================
+def verificar_sqlite(caminho: str) -> None:
+    """Falha se o arquivo não for um SQLite íntegro (PRAGMA integrity_check)."""
+    with open(caminho, "rb") as f:
+        if f.read(16) != b"SQLite format 3\x00":
+            raise ErroDownload("Arquivo baixado não é um banco SQLite.")
+    con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+    try:
+        res = con.execute("PRAGMA integrity_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise ErroDownload(f"Banco baixado corrompido: {e}") from e
+    finally:
+        con.close()
+        # Banco em modo WAL: a leitura só-leitura deixa -wal/-shm vazios para trás
+        _remover_auxiliares(caminho)
+    if res != "ok":
+        raise ErroDownload(f"integrity_check falhou: {res}")
+
+# =====================================================
+# SNAPSHOT PARA ENVIO
+# =====================================================
+def gerar_snapshot(caminho: str, timeout: float = 60) -> str:
+    """Cópia compactada e consistente do banco num temporário ao lado; quem chama apaga.
+
+    `VACUUM INTO` lê numa transação só: entram todos os commits (inclusive os
+    que ainda estão no -wal) e nenhuma escrita pela metade, sem páginas livres.
+    Em SQLite < 3.27 cai na API de backup (consistente, mas sem compactar).
+    """
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix=".snapshot_", suffix=".db")
+    os.close(fd)
+    os.remove(tmp)  # VACUUM INTO exige destino inexistente
+    con = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, timeout=timeout)
+    try:
+        try:
+            con.execute("VACUUM INTO ?", (tmp,))
+        except sqlite3.OperationalError as e:
+            if "syntax error" not in str(e):
+                raise
+            destino = sqlite3.connect(tmp)
+            try:
+                con.backup(destino)
+            finally:
+                destino.close()
+    except BaseException:
+        _remover(tmp, None)
+        raise
+    finally:
+        con.close()
+    return tmp
+
+# =====================================================
+# DOWNLOAD EM STREAMING
+# =====================================================
+def baixar_arquivo(url: str, destino: str, headers: dict | None = None, params: dict | None = None,
+                   compressao: str | None = None, tamanho: int | None = None,
+                   sha1_git: str | None = None, sha256: str | None = None,
+                   sqlite: bool = True, retries: int = 3, timeout: int = 30) -> int:
+    """Baixa `url` em blocos para um temporário e só então o move atomicamente para `destino`.
+
+    - `compressao` ("gzip"/"zstd") descompacta durante o download;
+    - `tamanho` e `sha1_git` conferem os bytes recebidos, como a API do GitHub os
+      descreve (`size` e `sha` do blob; o hash do git exige o tamanho);
+    - `sha256` confere o arquivo final; `sqlite=True` exige PRAGMA integrity_check ok.
+
+    Qualquer falha remove o temporário e levanta ErroDownload, sem tocar em `destino`.
+    Retorna o tamanho final em bytes.
+    """
+    if sha1_git and tamanho is None:
+        raise ValueError("sha1_git exige o tamanho do blob.")
+    pasta = os.path.dirname(os.path.abspath(destino))
+    os.makedirs(pasta, exist_ok=True)
+
+    for i in range(retries + 1):
+        fd, tmp = tempfile.mkstemp(dir=pasta, prefix=".download_", suffix=".part")
+        try:
+            with requests.get(url, headers=headers, params=params, stream=True, timeout=timeout) as r:
+                if r.status_code in (429, 500, 502, 503, 504) and i < retries:
+                    raise requests.RequestException(f"status transitório {r.status_code}")
+                if r.status_code != 200:
+                    raise ErroDownload(f"Download falhou (status {r.status_code}).")
+
+                dec = _descompressor(compressao)
+                # SHA-1 de blob do git: 'blob <tamanho>\0' + conteúdo
+                h_git = hashlib.sha1(f"blob {tamanho}\0".encode()) if sha1_git else None
+                h_final = hashlib.sha256()
+                recebidos = escritos = 0
+                with os.fdopen(fd, "wb") as f:
+                    fd = None
+                    for bloco in r.iter_content(chunk_size=CHUNK):
+                        if not bloco:
+                            continue
+                        recebidos += len(bloco)
+                        if h_git is not None:
+                            h_git.update(bloco)
+                        try:
+                            dados = dec.decompress(bloco) if dec else bloco
+                        except ERROS_DESCOMPRESSAO as e:
+                            raise ErroDownload(f"Arquivo compactado inválido: {e}") from e
+                        if dados:
+                            f.write(dados)
+                            h_final.update(dados)
+                            escritos += len(dados)
+                    if dec is not None and hasattr(dec, "flush"):
+                        try:
+                            resto = dec.flush()
+                        except ERROS_DESCOMPRESSAO as e:
+                            raise ErroDownload(f"Arquivo compactado inválido: {e}") from e
+                        if resto:
+                            f.write(resto)
+                            h_final.update(resto)
+                            escritos += len(resto)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if tamanho is not None and recebidos != tamanho:
+                raise ErroDownload(f"Tamanho recebido {recebidos} difere do esperado {tamanho}.")
+            if dec is not None and getattr(dec, "eof", True) is False:
+                raise ErroDownload("Arquivo compactado truncado.")
+            if h_git is not None and h_git.hexdigest() != sha1_git:
+                raise ErroDownload("SHA do blob baixado não confere com o do repositório.")
+            if sha256 and h_final.hexdigest() != sha256:
+                raise ErroDownload("SHA-256 do arquivo baixado não confere.")
+            if sqlite:
+                verificar_sqlite(tmp)
+
+            os.replace(tmp, destino)
+            return escritos
+        except requests.RequestException as e:
+            _remover(tmp, fd)
+            if i == retries:
+                raise ErroDownload(f"Falha de rede no download: {e}") from e
+            time.sleep((2 ** i) + 0.2)
+        except BaseException:
+            _remover(tmp, fd)
+            raise
+    raise ErroDownload("Download não concluído.")
+
+def _remover(tmp: str, fd: int | None) -> None:
+    if fd is not None:
+        os.close(fd)
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    _remover_auxiliares(tmp)
+
+def _remover_auxiliares(caminho: str) -> None:
+    """Apaga os arquivos -wal/-shm/-journal que o SQLite cria ao lado de `caminho`."""
+    for sufixo in ("-wal", "-shm", "-journal"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)